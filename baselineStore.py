@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+
+# Sequential baselines of the speedup, pooled across campaigns and checked
+#
+#     python baselineStore.py completed_logs logs_again
+#
+# Every sequential.dat (<committed> <objects> <seconds>) of the run sets below
+# the given roots is one row of a table indexed by model and LP count
+# (the model is the Model column of the run set's csv, else the part of the
+# directory name before the first '-'). Each baseline is checked against the
+# parallel runs next to it:
+#     invalid     the file is empty or malformed
+#     mismatch    its committed events differ from the median Events_Committed
+#                 of the runs by more than committedTolerance, or its object
+#                 count from their LP count: it did not simulate the same
+#                 workload
+#     unchecked   there are no runs to compare with
+# Invalid and mismatching baselines are left out.
+#
+# Baselines with the same model, LP count and committed events are
+# repetitions of one workload: their mean time and its C.I. (statsEngine.py)
+# are the baseline of the speedup. Rows of the parallel runs are matched to
+# the workload of their model and LP count with the nearest committed event
+# count, within committedTolerance, so models that share an LP count but not
+# a workload (epidemic-10k-ba and epidemic-100k-ba) are kept apart. Rows
+# without a matching workload get no speedup (NaN).
+#
+# What a run set tells about its baseline is kept in .baseline.json next to
+# it and re-read when its csv or sequential.dat changes, so up-to-date
+# directories do not parse their csv again.
+
+import argparse
+import json
+import os
+import sys
+
+###### Settings go here ######
+
+# Relative difference of committed events still counted as the same workload
+committedTolerance = 1e-4
+
+indexFileName   = '.baseline.json'
+
+###### Don't edit below here ######
+
+tableColumns    = ['Model', 'Number_of_Objects', 'Events_Committed', 'Seconds',
+                   'Parallel_Committed', 'status', 'path']
+usable          = ('ok', 'unchecked')
+workloadKeys    = ['Model', 'Number_of_Objects', 'Events_Committed']
+
+
+def run_set_record(dirPath, save=True):
+    '''Baseline fields of the catalog record of one run set, from
+    .baseline.json while its csv and sequential.dat are unchanged'''
+    from campaignCatalog import read_baseline_fields, run_files, signature
+
+    dirPath = os.path.normpath(os.path.abspath(dirPath))
+    csvFile, seqFile, _ = run_files(dirPath)
+    sig = signature([p for p in (csvFile, seqFile) if p])
+    indexFile = os.path.join(dirPath, indexFileName)
+    if os.path.exists(indexFile):
+        try:
+            with open(indexFile) as fp:
+                saved = json.load(fp)
+            if saved.get('signature') == sig:
+                return saved['record']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    record = {'path': dirPath, 'sequential': seqFile, **read_baseline_fields(csvFile, seqFile)}
+    if save and seqFile:
+        tmpPath = f'{indexFile}.{os.getpid()}.tmp'
+        try:
+            with open(tmpPath, 'w') as fp:
+                json.dump({'signature': sig, 'record': record}, fp, indent=1)
+            os.replace(tmpPath, indexFile)
+        except OSError:
+            pass        # read-only tree: checked again next time
+    return record
+
+def baseline_records(roots=(), own=None):
+    '''Baseline records of the run sets with a sequential.dat below roots,
+    plus the record own'''
+    from campaignCatalog import find_run_sets, run_files
+
+    records = {}
+    for root in roots:
+        if not os.path.isdir(root):
+            continue
+        for dirPath in find_run_sets(root):
+            # Only run sets with a baseline: their csv is read at most once
+            if run_files(dirPath)[1]:
+                record = run_set_record(dirPath)
+                records[record['path']] = record
+    if own:
+        records[own['path']] = own
+    return [r for _, r in sorted(records.items()) if r['sequential']]
+
+def model_name(record):
+    return record['simModel'] or os.path.basename(record['path']).split('-')[0]
+
+def check(record):
+    '''Status of the sequential baseline of a record (see above)'''
+    baseline, committed = record['baseline'], record['committed']
+    if baseline is None:
+        return 'invalid'
+    if committed is None:
+        return 'unchecked'
+    if abs(baseline[0] - committed) > committedTolerance * baseline[0] or \
+            baseline[1] != record['lpCount']:
+        return 'mismatch'
+    return 'ok'
+
+def same_workload(model, lpCount, committed, baseline):
+    return model == baseline['Model'] and lpCount == baseline['Number_of_Objects'] and \
+        abs(baseline['Events_Committed'] - committed) <= committedTolerance * baseline['Events_Committed']
+
+def load_baselines(dirPath=None, roots=()):
+    '''Baselines of dirPath, pooled with those below roots: {'baselines':
+    one entry per sequential.dat with its status, 'key': digest of the usable
+    ones, 'warnings': messages about dirPath's own baseline and runs}.
+    Cheap while nothing changed; see baseline_table and workload_stats.'''
+    from plotManifest import digest
+
+    own = run_set_record(dirPath) if dirPath else None
+    baselines = []
+    for record in baseline_records(roots, own):
+        baseline = record['baseline']
+        baselines.append({'Model': model_name(record),
+                          'Number_of_Objects': baseline[1] if baseline else record['lpCount'],
+                          'Events_Committed': baseline[0] if baseline else None,
+                          'Seconds': baseline[2] if baseline else None,
+                          'Parallel_Committed': record['committed'],
+                          'status': check(record),
+                          'path': record['sequential']})
+    use = [b for b in baselines if b['status'] in usable]
+
+    warnings = []
+    if own and own['sequential']:
+        seqFile = os.path.join(dirPath, 'sequential.dat')
+        status = check(own)
+        if status == 'invalid':
+            warnings.append(f"{seqFile}: empty or malformed sequential baseline, left out")
+        elif status == 'mismatch':
+            warnings.append(f"{seqFile}: {own['baseline'][0]} committed events and "
+                            f"{own['baseline'][1]} objects, the runs commit {own['committed']} "
+                            f"with {own['lpCount']} LPs; sequential baseline left out")
+    if own and own['committed'] is not None and \
+            not any(same_workload(model_name(own), own['lpCount'], own['committed'], b) for b in use):
+        warnings.append(f"{dirPath}: no sequential baseline of {model_name(own)} with "
+                        f"{own['lpCount']} LPs and {own['committed']} committed events; "
+                        f"speedup left empty")
+
+    key = digest(committedTolerance, [[b[k] for k in workloadKeys + ['Seconds']] for b in use])
+    return {'baselines': baselines, 'key': key, 'warnings': warnings}
+
+def baseline_table(baselines):
+    '''One row per sequential.dat, indexed by Model and Number_of_Objects'''
+    import pandas as pd
+
+    table = pd.DataFrame(baselines['baselines'], columns=tableColumns)
+    table = table.astype({'Number_of_Objects': 'Int64', 'Events_Committed': 'Int64',
+                          'Seconds': 'float64', 'Parallel_Committed': 'Int64'})
+    return table.set_index(['Model', 'Number_of_Objects']).sort_index()
+
+def workload_stats(baselines):
+    '''Repetitions, mean and C.I. of the usable baselines of every workload'''
+    import pandas as pd
+    from statsEngine import compute_stats
+
+    runs = baseline_table(baselines).reset_index()
+    runs = runs[runs['status'].isin(usable)]
+    columns = ['Repetitions', 'Seconds_Mean', 'Seconds_CI_Lower', 'Seconds_CI_Upper']
+    if runs.empty:
+        index = pd.MultiIndex.from_arrays([[], [], []], names=workloadKeys)
+        return pd.DataFrame(columns=columns, index=index, dtype=float)
+
+    runs = runs.astype({'Number_of_Objects': 'int64', 'Events_Committed': 'int64'})
+    stats = compute_stats(runs, workloadKeys, ['Seconds'])
+    stats['Repetitions'] = runs.groupby(workloadKeys, sort=True).size()
+    return stats[columns].sort_index()
+
+def baseline_seconds(frame, workloads):
+    '''Baseline time (workload mean) of every row of frame, NaN where no
+    workload matches its Model, Number_of_Objects and Events_Committed'''
+    import numpy as np
+
+    seconds = np.full(len(frame), np.nan)
+    if frame.empty or workloads.empty:
+        return seconds
+
+    models = frame['Model'].astype(str).to_numpy()
+    lpCounts = frame['Number_of_Objects'].to_numpy()
+    committed = frame['Events_Committed'].to_numpy(dtype=float)
+    for (model, lpCount), group in workloads.groupby(level=['Model', 'Number_of_Objects'], sort=False):
+        rows = (models == model) & (lpCounts == lpCount)
+        if not rows.any():
+            continue
+        # Nearest workload by committed events (the index is sorted)
+        known = group.index.get_level_values('Events_Committed').to_numpy(dtype=float)
+        values = committed[rows]
+        right = np.clip(np.searchsorted(known, values), 0, len(known) - 1)
+        left = np.clip(right - 1, 0, len(known) - 1)
+        nearest = np.where(np.abs(known[left] - values) <= np.abs(known[right] - values), left, right)
+        matched = np.abs(known[nearest] - values) <= committedTolerance * known[nearest]
+        seconds[rows] = np.where(matched, group['Seconds_Mean'].to_numpy()[nearest], np.nan)
+    return seconds
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="List and check the sequential baselines of the speedup")
+    parser.add_argument("roots", nargs='+', help="Result trees or run set directories (e.g., 'completed_logs')")
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    import pandas as pd
+
+    baselines = load_baselines(roots=[r for r in args.roots if os.path.isdir(r)])
+    table = baseline_table(baselines)
+    with pd.option_context('display.width', 200, 'display.max_rows', None,
+                           'display.max_colwidth', 80):
+        shown = table.assign(path=[os.path.relpath(p) for p in table['path']])
+        print(shown.to_string())
+        print()
+        print(workload_stats(baselines).to_string())
+
+    flagged = table[table['status'] == 'mismatch']
+    if len(flagged):
+        print(f"\n{len(flagged)} baselines do not match their runs", file=sys.stderr)
+    sys.exit(1 if len(flagged) else 0)
+
+if __name__ == "__main__":
+    main()
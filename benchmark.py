@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+
+# Benchmarks the plotting pipeline on synthetic schedule queue data
+#
+# For every size in sizes a raw scheduleq.csv (and sequential.dat) with the
+# columns of the variables file is generated, then each stage of the
+# pipeline is timed on it: parsing with rawSchema.read_raw as the scripts
+# do, the cache, derived metrics, stats, stats csv writing, plot_stats,
+# calc_and_plot end to end (and again when up to date),
+# plotCombined.calc_and_plot and the unified plots (load, aggregation and
+# rendering).
+# Results are written as JSON so runs can be compared with --compare.
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+###### Settings go here ######
+
+sizes           = [1000, 10000, 100000, 1000000, 10000000]
+
+branches        = ['master', 'fossil_thread']
+threadCounts    = [1, 2, 4, 8, 16]
+queueTypes      = ['stl-multiset', 'ladder-queue', 'splay-tree']
+queueCounts     = [1, 2, 4, 8]
+
+modelName       = 'pcs'
+lpCount         = 10000
+committed       = 5845847       # Events_Committed of every run
+
+chunkRows       = 1000000       # rows generated and written per chunk
+
+outputDir       = 'benchmarks'
+
+###### Don't edit below here ######
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+def generate_scheduleq(dirPath, rows=None, repetitions=None, branches=branches,
+                       threadCounts=threadCounts, queueTypes=queueTypes,
+                       queueCounts=queueCounts, seed=0):
+    '''Writes a synthetic scheduleq.csv and sequential.dat into dirPath.
+
+    Every branch x thread count x queue type x queue count configuration
+    gets repetitions runs (as consecutive rows, like the real sweeps). With
+    rows instead, repetitions is chosen to give at least that many rows and
+    the file is cut at rows. Returns the number of rows written.'''
+    import numpy as np
+    import pandas as pd
+    from rawSchema import read_variables
+
+    configs = [(b, t, q, c) for b in branches for t in threadCounts
+                            for q in queueTypes for c in queueCounts]
+    if repetitions is None:
+        repetitions = max(1, -(-rows // len(configs)))
+    total = len(configs) * repetitions if rows is None else rows
+
+    columns = read_variables()
+    rng = np.random.default_rng(seed)
+    configBranch = np.array([c[0] for c in configs], dtype=object)
+    configThread = np.array([c[1] for c in configs])
+    configType   = np.array([c[2] for c in configs], dtype=object)
+    configCount  = np.array([c[3] for c in configs])
+
+    os.makedirs(dirPath, exist_ok=True)
+    outFile = os.path.join(dirPath, 'scheduleq.csv')
+    for start in range(0, total, chunkRows):
+        n = min(chunkRows, total - start)
+        config = (np.arange(start, start + n) // repetitions) % len(configs)
+        threads = configThread[config]
+
+        # Runtime shrinks with threads, rollbacks grow with them
+        runtime = 16. * (0.3 + 0.7 / threads) * rng.lognormal(0., 0.08, n)
+        primary = rng.poisson(2000. * threads, n)
+        secondary = rng.poisson(600. * threads, n)
+        processed = committed + 40 * (primary + secondary) + rng.poisson(1000., n)
+        localPos = rng.poisson(0.99 * processed)
+        remotePos = rng.poisson(0.006 * processed)
+
+        chunk = pd.DataFrame({
+            'branch'                        : configBranch[config],
+            'Model'                         : modelName,
+            'Model_Command'                 : f'mpirun-np2-hostolaf,honi./{modelName}_sim',
+            'Max_Simulation_Time'           : 500,
+            'Worker_Thread_Count'           : threads,
+            'Schedule_Queue_Type'           : configType[config],
+            'Schedule_Queue_Count'          : configCount[config],
+            'is_LP_Migration_ON'            : np.nan,
+            'GVT_Method'                    : 'asynchronous',
+            'State_Save_Period'             : 32,
+            'Simulation_Runtime_(secs.)'    : runtime.round(4),
+            'Number_of_Objects'             : lpCount,
+            'Local_Positive_Events_Sent'    : localPos,
+            'Remote_Positive_Events_Sent'   : remotePos,
+            'Local_Negative_Events_Sent'    : rng.poisson(3. * primary),
+            'Remote_Negative_Events_Sent'   : rng.poisson(0.15 * primary),
+            'Primary_Rollbacks'             : primary,
+            'Secondary_Rollbacks'           : secondary,
+            'Coast_Forwarded_Events'        : rng.poisson(25. * primary),
+            'Cancelled_Events'              : rng.poisson(3.5 * primary),
+            'Events_Processed'              : processed,
+            'Events_Committed'              : committed,
+            'Events_for_Starved_Objects'    : rng.poisson(11000., n),
+            'Sched_Event_Swaps_Success'     : rng.poisson(270000., n),
+            'Sched_Event_Swaps_Failed'      : rng.poisson(100., n),
+            'Average_Memory_Usage_(MB)'     : rng.integers(120, 160, n),
+        }, columns=columns)
+        chunk.to_csv(outFile, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+
+    with open(os.path.join(dirPath, 'sequential.dat'), 'w') as fp:
+        fp.write(f'{committed} {lpCount} 16.1427\n')
+    return total
+
+class Timer:
+    '''Records the wall time of named stages'''
+    def __init__(self):
+        self.stages = {}
+
+    def __call__(self, name, func, *args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        self.stages[name] = self.stages.get(name, 0.) + time.perf_counter() - start
+        return result
+
+def bench_size(workDir, rows):
+    '''Times every pipeline stage on a fresh directory of rows rows'''
+    import plotCombined
+    import rawSchema
+    import plotScheduleQ as pipeline
+    import customOverallplot
+    from baselineStore import load_baselines, workload_stats
+    from derivedMetrics import config_columns
+    from statsEngine import compute_stats, stats_table, write_stats
+
+    timer = Timer()
+    dirPath = os.path.join(workDir, f'{modelName}-{rows}') + os.sep
+    timer('generate', generate_scheduleq, dirPath, rows)
+    inFile = dirPath + pipeline.rawDataFileName + '.csv'
+    workloads = workload_stats(load_baselines(dirPath))
+
+    # Loading as the scripts load: typed and pruned parse, cache build, cache hit
+    columns = pipeline.raw_columns()
+    data = timer('read_raw', rawSchema.read_raw, inFile, columns, cached=False)
+    del data
+    timer('cache_build', rawSchema.read_raw, inFile, columns)
+    data = timer('cache_load', rawSchema.read_raw, inFile, columns)
+    timer('derive', pipeline.add_derived_metrics, data, workloads)
+
+    # Stats and plots of every filter value, as calc_and_plot produces them
+    statsDir = os.path.join(workDir, 'stage-stats') + os.sep
+    os.makedirs(statsDir + 'stats/' + pipeline.rawDataFileName, exist_ok=True)
+    os.makedirs(statsDir + 'plots/' + pipeline.rawDataFileName, exist_ok=True)
+    metrics = [param['name'] for param in pipeline.metricList]
+    for searchAttrs in pipeline.searchAttrsList:
+        groupbyList = list(searchAttrs['groupby']) + [searchAttrs['filter']]
+        filterName = searchAttrs['filter']
+        for filterValue in data[filterName].unique().tolist():
+            filteredData = data[data[filterName] == filterValue]
+            table = timer('compute_stats', lambda: stats_table(compute_stats(
+                            filteredData, groupbyList, metrics, ciMethod=pipeline.ciMethod)))
+            fileName = searchAttrs['output'] + str(filterValue)
+            timer('write_stats', write_stats, table,
+                  statsDir + 'stats/' + pipeline.rawDataFileName + '/' + fileName + '.csv')
+            timer('plot_stats', pipeline.plot_stats, statsDir, fileName,
+                  searchAttrs['groupby'][0], searchAttrs['groupby'][1], filterName,
+                  filterValue, modelName, lpCount, stats=table)
+
+    # End to end, then again with nothing to do
+    streamed = os.path.getsize(inFile) > pipeline.streamThresholdMB * 1024 * 1024
+    tables = timer('calc_and_plot', pipeline.calc_and_plot, dirPath)
+    timer('calc_and_plot_current', pipeline.calc_and_plot, dirPath)
+    timer('plotCombined', plotCombined.calc_and_plot, dirPath, tables)
+
+    # Unified plots of the generated model: one load and one grouped pass
+    frame = timer('unified_load', customOverallplot.load_unified_frame, [(modelName, inFile)],
+                  config_columns(customOverallplot.plot_configs))
+    grouped = timer('unified_aggregate', customOverallplot.aggregate_configs,
+                    frame, customOverallplot.plot_configs)
+    customOverallplot.set_style()
+    for config in customOverallplot.plot_configs:
+        timer('create_unified_plot', customOverallplot.create_unified_plot,
+              grouped[config['title']], config, workDir)
+
+    return {'rows': rows, 'bytes': os.path.getsize(inFile), 'streamed': streamed,
+            'stages': {name: round(secs, 4) for name, secs in timer.stages.items()}}
+
+def git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=here,
+                             capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(current, baseline):
+    '''Prints stage time ratios (current / baseline) for sizes in both runs'''
+    old = {r['rows']: r['stages'] for r in baseline['results']}
+    for result in current['results']:
+        if result['rows'] not in old:
+            continue
+        print(f"rows {result['rows']:,}")
+        for name, secs in result['stages'].items():
+            before = old[result['rows']].get(name)
+            ratio = f'{secs / before:6.2f}x' if before else '      -'
+            print(f"  {name:24s} {secs:10.3f} s  {ratio}")
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Time the plotting pipeline on synthetic scheduleq.csv files")
+    parser.add_argument("--sizes", type=lambda s: [int(float(v)) for v in s.split(',')],
+                        default=sizes, help="Comma separated row counts (default: 1e3 to 1e7)")
+    parser.add_argument("--output", help="JSON results file (default: benchmarks/bench_<timestamp>.json)")
+    parser.add_argument("--compare", help="Earlier JSON results to compare against")
+    parser.add_argument("--workdir", help="Keep the generated data in this directory")
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+
+    # Headless rendering, like the batch runs
+    import matplotlib
+    matplotlib.use('Agg')
+
+    stamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
+    workDir = args.workdir or tempfile.mkdtemp(prefix='plotbench_')
+    run = {'timestamp': stamp, 'commit': git_commit(), 'python': sys.version.split()[0],
+           'platform': platform.platform(), 'cpus': os.cpu_count(), 'results': []}
+    try:
+        for rows in args.sizes:
+            sizeDir = os.path.join(workDir, str(rows))
+            result = bench_size(sizeDir, rows)
+            run['results'].append(result)
+            total = sum(result['stages'].values())
+            print(f"{rows:>10,} rows  {total:8.2f} s  " +
+                  '  '.join(f"{k}={v:.3f}" for k, v in result['stages'].items()))
+            if not args.workdir:
+                shutil.rmtree(sizeDir, ignore_errors=True)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workDir, ignore_errors=True)
+
+    outFile = args.output or os.path.join(here, outputDir, f'bench_{stamp}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(outFile)), exist_ok=True)
+    with open(outFile, 'w') as fp:
+        json.dump(run, fp, indent=1)
+    print(f"Results written to {outFile}")
+
+    if args.compare:
+        with open(args.compare) as fp:
+            compare(run, json.load(fp))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+
+# Tests every branch against a baseline branch and fails on regressions
+#
+#     python branchRegression.py completed_logs --baseline master
+#
+# The runs of every run set below the given directories are pooled (rows
+# flagged by the run logs are left out, see runLog.py) and grouped by
+# configuration: Model, LP count, thread count, queue type and queue count.
+# In each configuration every other branch is compared with the baseline on
+# each metric of metricList (raw or derived, see derivedMetrics.py), with a
+# Welch t-test and a Mann-Whitney U test (normal approximation with tie and
+# continuity correction). Both are computed for all comparisons at once on
+# padded arrays, not test by test.
+#
+# The p-values of the gating test are corrected for the number of
+# comparisons (Holm, or Benjamini-Hochberg). A comparison is a regression
+# when its corrected p-value is below alpha, the branch is worse than the
+# baseline and the relative change is at least minChange. Effect sizes are
+# reported as Hedges' g and Cliff's delta. Exits 1 when there is a regression.
+
+import argparse
+import os
+import sys
+
+###### Settings go here ######
+
+baselineBranch  = 'master'
+
+configColumns   = [ 'Model',
+                    'Number_of_Objects',
+                    'Worker_Thread_Count',
+                    'Schedule_Queue_Type',
+                    'Schedule_Queue_Count'
+                  ]
+
+# better: which direction is an improvement
+metricList      =   [
+                        {   'name'  : 'Simulation_Runtime_(secs.)',
+                            'better': 'lower'   },
+
+                        {   'name'  : 'Event_Processing_Rate_(per_sec)',
+                            'better': 'higher'  },
+
+                        {   'name'  : 'Average_Memory_Usage_(MB)',
+                            'better': 'lower'   }
+                    ]
+
+alpha           = 0.05
+gateTest        = 'welch'       # 'welch' or 'mannwhitney'
+correction      = 'holm'        # 'holm' or 'bh'
+minChange       = 0.02          # smallest relative change reported as a regression
+
+###### Don't edit below here ######
+
+tests           = ('welch', 'mannwhitney')
+corrections     = ('holm', 'bh')
+
+
+def load_runs(paths):
+    '''One frame of the runs of every run set below paths'''
+    import pandas as pd
+    from campaignCatalog import find_run_sets
+    from derivedMetrics import derive, needs_workloads, raw_inputs
+    from rawSchema import SchemaError, read_raw
+    from runLog import apply_run_log, load_run_log
+
+    metrics = [m['name'] for m in metricList]
+    columns = list(dict.fromkeys(['branch'] + configColumns + raw_inputs(metrics)))
+
+    frames = []
+    for path in paths:
+        for dirPath in find_run_sets(path):
+            csvFile = os.path.join(dirPath, 'scheduleq.csv')
+            if not os.path.exists(csvFile):
+                continue
+            try:
+                frame = read_raw(csvFile, columns)
+            except SchemaError as err:
+                print(f"Skipping {dirPath}: {err}", file=sys.stderr)
+                continue
+            frame = apply_run_log(frame, load_run_log(dirPath))
+            # Derived metrics (derivedMetrics.py) against the run set's own baselines
+            workloads = None
+            if needs_workloads(metrics):
+                from baselineStore import load_baselines, workload_stats
+                workloads = workload_stats(load_baselines(dirPath))
+            frames.append(derive(frame, metrics, workloads))
+    if not frames:
+        return pd.DataFrame(columns=columns)
+
+    frame = pd.concat(frames, ignore_index=True)
+    for column in frame.columns:
+        if frame[column].dtype == object:
+            frame[column] = frame[column].astype('category')
+    return frame
+
+def padded_samples(frame, metric, keys):
+    '''Returns (groups, samples): the group keys and an (ngroups x maxn)
+    array of each group's values of metric, padded with NaN'''
+    import numpy as np
+
+    data = frame.dropna(subset=[metric])
+    grouped = data.groupby(keys, observed=True, sort=True)
+    codes = grouped.ngroup().to_numpy()
+    groups = grouped.size()
+    counts = groups.to_numpy()
+
+    order = np.argsort(codes, kind='stable')
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    position = np.arange(len(codes)) - starts[codes[order]]
+    samples = np.full((len(counts), counts.max() if len(counts) else 0), np.nan)
+    samples[codes[order], position] = data[metric].to_numpy(dtype=float)[order]
+    return groups.index.to_frame(index=False), samples
+
+def welch_test(x, y):
+    '''Row-wise Welch t-test of padded samples x against y: (t, df, p)'''
+    import numpy as np
+    import scipy.stats as sps
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        nx, ny = np.sum(~np.isnan(x), 1), np.sum(~np.isnan(y), 1)
+        vx, vy = np.nanvar(x, 1, ddof=1) / nx, np.nanvar(y, 1, ddof=1) / ny
+        diff = np.nanmean(x, 1) - np.nanmean(y, 1)
+        t = diff / np.sqrt(vx + vy)
+        df = (vx + vy) ** 2 / (vx ** 2 / (nx - 1) + vy ** 2 / (ny - 1))
+        p = 2 * sps.t.sf(np.abs(t), df)
+        # Constant samples: certain when the means differ, else no evidence
+        constant = (vx + vy) == 0
+        p[constant] = np.where(diff[constant] == 0, 1., 0.)
+        p[(nx < 2) | (ny < 2)] = np.nan
+    return t, df, p
+
+def mann_whitney_test(x, y):
+    '''Row-wise two-sided Mann-Whitney U test of padded samples x against
+    y (normal approximation, tie and continuity corrected): (U, p)'''
+    import numpy as np
+    import scipy.stats as sps
+
+    nx, ny = np.sum(~np.isnan(x), 1), np.sum(~np.isnan(y), 1)
+    xs, ys = x[:, :, None], y[:, None, :]
+    u = np.sum(xs > ys, axis=(1, 2)) + 0.5 * np.sum(xs == ys, axis=(1, 2))
+
+    # Tie groups of the pooled sample: sum of t^3 - t = sum over values of c^2 - 1
+    pooled = np.concatenate([x, y], axis=1)
+    same = np.sum(pooled[:, :, None] == pooled[:, None, :], axis=2)
+    ties = np.sum(np.where(np.isnan(pooled), 0, same ** 2 - 1), axis=1)
+
+    n = nx + ny
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sigma = np.sqrt(nx * ny / 12. * ((n + 1) - ties / (n * (n - 1))))
+        z = (np.abs(u - nx * ny / 2.) - 0.5) / sigma
+        p = np.minimum(1., 2 * sps.norm.sf(np.maximum(z, 0.)))
+    p[sigma == 0] = 1.
+    p[(nx < 1) | (ny < 1)] = np.nan
+    return u, p
+
+def correct(p, method=correction):
+    '''Multiple-comparison adjusted p-values (NaN entries are left out)'''
+    import numpy as np
+
+    adjusted = np.full_like(p, np.nan)
+    valid = ~np.isnan(p)
+    values = p[valid]
+    m = len(values)
+    if m == 0:
+        return adjusted
+    order = np.argsort(values)
+    ranked = values[order]
+    if method == 'holm':
+        steps = np.maximum.accumulate(ranked * (m - np.arange(m)))
+    elif method == 'bh':
+        steps = np.minimum.accumulate((ranked * m / np.arange(1, m + 1))[::-1])[::-1]
+    else:
+        raise ValueError(f'unknown correction {method!r}, expected one of {corrections}')
+    result = np.empty(m)
+    result[order] = np.minimum(steps, 1.)
+    adjusted[valid] = result
+    return adjusted
+
+def compare_branches(frame, baseline=baselineBranch, test=gateTest, method=correction,
+                     alpha=alpha, minChange=minChange):
+    '''Frame of every branch x configuration x metric comparison with the
+    baseline: sample sizes, means, relative change, test statistics, raw and
+    corrected p-values, effect sizes and the regression verdict'''
+    import numpy as np
+    import pandas as pd
+
+    if test not in tests:
+        raise ValueError(f'unknown test {test!r}, expected one of {tests}')
+    keys = configColumns + ['branch']
+    results = []
+    for param in metricList:
+        metric = param['name']
+        if metric not in frame.columns or frame.empty:
+            continue
+        groups, samples = padded_samples(frame, metric, keys)
+        groups['group'] = np.arange(len(groups))
+
+        # Pair every non-baseline group with the baseline group of its configuration
+        isBase = groups['branch'].astype(str) == baseline
+        pairs = groups[~isBase].merge(groups[isBase].drop(columns='branch'),
+                                      on=configColumns, suffixes=('', '_base'))
+        if pairs.empty:
+            continue
+        x = samples[pairs['group'].to_numpy()]
+        y = samples[pairs['group_base'].to_numpy()]
+
+        nx, ny = np.sum(~np.isnan(x), 1), np.sum(~np.isnan(y), 1)
+        mx, my = np.nanmean(x, 1), np.nanmean(y, 1)
+        t, df, pWelch = welch_test(x, y)
+        u, pMann = mann_whitney_test(x, y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pooled = np.sqrt(((nx - 1) * np.nanvar(x, 1, ddof=1) + (ny - 1) * np.nanvar(y, 1, ddof=1))
+                             / (nx + ny - 2))
+            hedges = (mx - my) / pooled * (1 - 3. / (4 * (nx + ny) - 9))
+            change = (mx - my) / np.abs(my)
+
+        pairs = pairs.drop(columns=['group', 'group_base'])
+        pairs = pairs.assign(metric=metric, baseline=baseline, n=nx, n_base=ny,
+                             mean=mx, mean_base=my, change=change,
+                             t=t, df=df, p_welch=pWelch, u=u, p_mannwhitney=pMann,
+                             hedges_g=hedges, cliffs_delta=2 * u / (nx * ny) - 1,
+                             worse=change > 0 if param['better'] == 'lower' else change < 0)
+        results.append(pairs)
+
+    if not results:
+        return pd.DataFrame()
+    result = pd.concat(results, ignore_index=True)
+    result['p_adjusted'] = correct(result['p_' + test].to_numpy(dtype=float), method)
+    result['regression'] = (result['p_adjusted'] < alpha) & result['worse'] & \
+                           (result['change'].abs() >= minChange)
+    return result
+
+def print_report(result, out=sys.stdout):
+    if result.empty:
+        print("No configuration has both the baseline and another branch", file=out)
+        return
+    regressions = result[result['regression']]
+    print(f"{len(result)} comparisons, {int(result['p_adjusted'].notna().sum())} tested, "
+          f"{len(regressions)} regressions", file=out)
+    for _, r in regressions.sort_values('p_adjusted').iterrows():
+        config = ' '.join(f"{r[c]}" for c in configColumns)
+        print(f"  {r['branch']} vs {r['baseline']} [{config}] {r['metric']}: "
+              f"{r['mean']:.4g} vs {r['mean_base']:.4g} ({r['change']:+.1%}), "
+              f"p={r['p_adjusted']:.3g}, g={r['hedges_g']:.2f}, delta={r['cliffs_delta']:.2f}",
+              file=out)
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Test every branch against a baseline branch and fail on significant regressions")
+    parser.add_argument("paths", nargs='+', help="Run set directories or result trees (e.g., 'completed_logs')")
+    parser.add_argument("--baseline", default=baselineBranch, help="Baseline branch (default: %(default)s)")
+    parser.add_argument("--test", choices=tests, default=gateTest, help="Test deciding regressions (default: %(default)s)")
+    parser.add_argument("--correction", choices=corrections, default=correction,
+                        help="Multiple-comparison correction (default: %(default)s)")
+    parser.add_argument("--alpha", type=float, default=alpha, help="Significance level (default: %(default)s)")
+    parser.add_argument("--min-change", type=float, default=minChange,
+                        help="Smallest relative change counted as a regression (default: %(default)s)")
+    parser.add_argument("--csv", help="Write every comparison to this csv file")
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    for path in args.paths:
+        if not os.path.isdir(path):
+            print(f'Invalid path to source: {path}')
+            sys.exit(2)
+
+    result = compare_branches(load_runs(args.paths), args.baseline, args.test, args.correction,
+                              args.alpha, args.min_change)
+    if args.csv:
+        result.to_csv(args.csv, index=False)
+    print_report(result)
+    sys.exit(1 if not result.empty and result['regression'].any() else 0)
+
+if __name__ == "__main__":
+    main()
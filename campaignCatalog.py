@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+
+# Indexes every result directory (run set) once and persists the index
+#
+# A run set is any directory holding a scheduleq.csv, sequential.dat or
+# errlog_*.config. Supported layouts:
+#     <root>/<model>/                            (GVT, GVT-new, logs_again, ...)
+#     <root>/                                    (e.g. the stray hashing/scheduleq.csv)
+#     <root>/<branch>_<YYYYMMDDhhmmss>/<model>/  (completed_logs)
+# The catalog is stored as JSON next to this script and refreshed
+# incrementally: a run set is re-read only when the size or mtime of one of
+# its files changed. Only the command line saves it (and the run log indexes
+# of the run sets); the scripts that query it build it in memory from the
+# saved copy and write nothing.
+
+import argparse
+import glob
+import json
+import os
+import re
+
+from runLog import flagged_rows, load_run_log
+
+###### Settings go here ######
+
+defaultRoots    = ['GVT', 'GVT-new', 'hashing', 'logs_again', 'unfied', 'completed_logs']
+
+catalogFileName = '.campaign_catalog.json'
+
+rawDataFileName = 'scheduleq'
+
+# Output directories written by the plotting scripts, never run sets
+skipDirs        = {'stats', 'plots', 'output_plots', '__pycache__'}
+
+###### Don't edit below here ######
+
+defaultCatalog  = os.path.join(os.path.dirname(os.path.abspath(__file__)), catalogFileName)
+
+campaignPattern = re.compile(r'^(?P<branch>.+)_(?P<timestamp>\d{14})$')
+
+catalogVersion  = 3
+
+
+def count_rows(path, blockSize=1 << 20):
+    '''Number of data rows of a csv file (lines minus the header)'''
+    lines = 0
+    last = b'\n'
+    with open(path, 'rb') as fp:
+        for block in iter(lambda: fp.read(blockSize), b''):
+            lines += block.count(b'\n')
+            last = block[-1:]
+    if last != b'\n':
+        lines += 1
+    return max(0, lines - 1)
+
+def read_sequential(seqFile):
+    '''Sequential baseline of sequential.dat (<committed> <objects> <seconds>)
+    as [committed events, objects, seconds], None when empty or malformed'''
+    if not seqFile or not os.path.exists(seqFile):
+        return None
+    with open(seqFile) as fp:
+        fields = fp.readline().split()
+    try:
+        committed, objects, seconds = int(fields[0]), int(fields[1]), float(fields[2])
+    except (IndexError, ValueError):
+        return None
+    if len(fields) != 3 or committed <= 0 or objects <= 0 or not seconds > 0:
+        return None
+    return [committed, objects, seconds]
+
+def read_workload(csvFile):
+    '''(model, LP count, median committed events) of the parallel runs in
+    the csv, None for what it does not tell'''
+    if not csvFile or not os.path.exists(csvFile):
+        return None, None, None
+    from rawSchema import SchemaError, read_raw
+    try:
+        runs = read_raw(csvFile, ['Model', 'Number_of_Objects', 'Events_Committed'], cached=False)
+    except SchemaError:
+        return None, None, None
+    if runs.empty:
+        return None, None, None
+    return (str(runs['Model'].iloc[0]), int(runs['Number_of_Objects'].iloc[0]),
+            int(runs['Events_Committed'].median()))
+
+def read_baseline_fields(csvFile, seqFile):
+    '''Model, LP count and median committed events of the runs, and the
+    sequential baseline (the LP count comes from it when there are no runs)'''
+    simModel, lpCount, committed = read_workload(csvFile)
+    baseline = read_sequential(seqFile)
+    if lpCount is None and baseline:
+        lpCount = baseline[1]
+    return {'simModel': simModel, 'lpCount': lpCount, 'committed': committed, 'baseline': baseline}
+
+def run_files(dirPath):
+    csvFile = os.path.join(dirPath, rawDataFileName + '.csv')
+    seqFile = os.path.join(dirPath, 'sequential.dat')
+    errlogs = sorted(glob.glob(os.path.join(dirPath, 'errlog_*.config')))
+    return (csvFile if os.path.exists(csvFile) else None,
+            seqFile if os.path.exists(seqFile) else None,
+            errlogs)
+
+def signature(paths):
+    sig = []
+    for path in paths:
+        st = os.stat(path)
+        sig.append([os.path.basename(path), st.st_size, st.st_mtime_ns])
+    return sig
+
+def find_run_sets(root):
+    '''Yields every run set directory under root'''
+    for dirPath, dirNames, _ in os.walk(root):
+        dirNames[:] = sorted(d for d in dirNames if d not in skipDirs and not d.startswith('.'))
+        csvFile, seqFile, errlogs = run_files(dirPath)
+        if csvFile or seqFile or errlogs:
+            yield dirPath
+
+def describe(dirPath, root, save=False):
+    '''Builds the catalog record of one run set; save writes its run log
+    index (.runlog.json)'''
+    csvFile, seqFile, errlogs = run_files(dirPath)
+    parts = os.path.relpath(dirPath, root).split(os.sep)
+    parts = [] if parts == ['.'] else parts
+
+    # The campaign directory may be above the scanned root
+    branch = timestamp = campaign = None
+    for part in os.path.abspath(dirPath).split(os.sep):
+        match = campaignPattern.match(part)
+        if match:
+            campaign = part
+            branch = match.group('branch')
+            timestamp = match.group('timestamp')
+
+    # Builds and failed runs from the run logs, see runLog.py
+    runLog = load_run_log(dirPath, save=save)
+
+    # A run set directly at the root of a collection has no model directory
+    model = parts[-1] if parts and parts[-1] != campaign else None
+
+    # Simulated model and workload of the runs, for matching sequential baselines
+    workload = read_baseline_fields(csvFile, seqFile)
+
+    return {
+        'root'      : root,
+        'path'      : dirPath,
+        'campaign'  : campaign,
+        'branch'    : branch,
+        'timestamp' : timestamp,
+        'model'     : model,
+        'simModel'  : workload['simModel'],
+        'lpCount'   : workload['lpCount'],
+        'committed' : workload['committed'],
+        'baseline'  : workload['baseline'],
+        'scheduleq' : csvFile,
+        'sequential': seqFile,
+        'errlogs'   : errlogs,
+        'rows'      : count_rows(csvFile) if csvFile else 0,
+        'builds'    : [b['branch'] for b in runLog['builds']],
+        'failedRuns': sum(b['failedRuns'] for b in runLog['builds']),
+        'flagged'   : len(flagged_rows(runLog)),
+        'signature' : signature([p for p in [csvFile, seqFile] + errlogs if p]),
+    }
+
+
+class Catalog:
+    def __init__(self, path=defaultCatalog):
+        self.path = path
+        self.base = os.path.dirname(os.path.abspath(path))
+        self.records = []
+        if os.path.exists(path):
+            with open(path) as fp:
+                saved = json.load(fp)
+            if saved.get('version') == catalogVersion:
+                self.records = [self._resolve(r) for r in saved['records']]
+
+    # Paths are stored relative to the catalog file so it can move with the tree
+    def _rel(self, path):
+        return os.path.relpath(os.path.abspath(path), self.base) if path else path
+
+    def _abs(self, path):
+        return os.path.normpath(os.path.join(self.base, path)) if path else path
+
+    def _resolve(self, record):
+        record = dict(record)
+        for key in ('root', 'path', 'scheduleq', 'sequential'):
+            record[key] = self._abs(record[key])
+        record['errlogs'] = [self._abs(p) for p in record['errlogs']]
+        return record
+
+    def _store(self, record):
+        record = dict(record)
+        for key in ('root', 'path', 'scheduleq', 'sequential'):
+            record[key] = self._rel(record[key])
+        record['errlogs'] = [self._rel(p) for p in record['errlogs']]
+        return record
+
+    def update(self, roots, save=False):
+        '''Rescans roots, re-reading only run sets whose files changed (and
+        saving their run log indexes when save is set)'''
+        roots = [os.path.normpath(os.path.abspath(r)) for r in roots if os.path.isdir(r)]
+        known = {r['path']: r for r in self.records}
+        inRoots = lambda p: any(p == r or p.startswith(r + os.sep) for r in roots)
+
+        scanned = {}
+        for root in roots:
+            for dirPath in find_run_sets(root):
+                old = known.get(dirPath)
+                csvFile, seqFile, errlogs = run_files(dirPath)
+                sig = signature([p for p in [csvFile, seqFile] + errlogs if p])
+                if old is not None and old['signature'] == sig and old['root'] == root:
+                    scanned[dirPath] = old
+                else:
+                    scanned[dirPath] = describe(dirPath, root, save)
+
+        # Keep run sets of roots that were not scanned this time
+        kept = [r for r in self.records if not inRoots(r['path'])]
+        self.records = sorted(kept + list(scanned.values()), key=lambda r: r['path'])
+        return self
+
+    def save(self):
+        tmpPath = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmpPath, 'w') as fp:
+            json.dump({'version': catalogVersion,
+                       'records': [self._store(r) for r in self.records]}, fp, indent=1)
+        os.replace(tmpPath, self.path)
+
+    def query(self, under=None, **filters):
+        '''Run sets matching every field=value filter, optionally below a directory'''
+        result = self.records
+        if under is not None:
+            under = os.path.normpath(os.path.abspath(under))
+            result = [r for r in result if r['path'] == under or r['path'].startswith(under + os.sep)]
+        for key, value in filters.items():
+            result = [r for r in result if r.get(key) == value]
+        return result
+
+def build_catalog(roots=defaultRoots, catalogPath=defaultCatalog):
+    '''Loads the persisted catalog and refreshes it in memory for roots;
+    nothing is written'''
+    return Catalog(catalogPath).update(roots)
+
+def find_run_set(dirPath):
+    '''Catalog record of a single directory, without touching the index'''
+    dirPath = os.path.normpath(os.path.abspath(dirPath))
+    csvFile, seqFile, errlogs = run_files(dirPath)
+    if not (csvFile or seqFile or errlogs):
+        return None
+    return describe(dirPath, os.path.dirname(dirPath))
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Index every result directory and list the run sets")
+    parser.add_argument("roots", nargs='*', default=defaultRoots,
+                        help="Result trees to scan (default: %(default)s)")
+    parser.add_argument("--catalog", default=defaultCatalog, help="Catalog file (default: %(default)s)")
+    parser.add_argument("--branch", help="Only list run sets of this campaign branch")
+    parser.add_argument("--model", help="Only list run sets of this model")
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    catalog = Catalog(args.catalog).update(args.roots, save=True)
+    catalog.save()
+
+    filters = {k: v for k, v in (('branch', args.branch), ('model', args.model)) if v}
+    for record in catalog.query(**filters):
+        print(f"{os.path.relpath(record['path']):60s} {str(record['branch'] or '-'):16s} "
+              f"{str(record['timestamp'] or '-'):14s} {str(record['lpCount'] or '-'):>7s} {record['rows']:6d} "
+              f"{record['failedRuns']:4d} {record['flagged']:6d}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+
+# Writes one self-contained HTML report per campaign
+#
+#     python campaignReport.py completed_logs/fossil_20240702003214
+#     python campaignReport.py completed_logs          (every campaign below)
+#
+# The report embeds the stats tables of temp.py (brought up to date with
+# calc_and_plot, without rendering any figure) as compact JSON: per stats
+# file and metric only the x values and the mean and C.I. of every key,
+# rounded to significantDigits. Nothing is parsed or drawn when the page
+# opens; a model's data is parsed and its charts are drawn as SVG by the
+# page itself when its section is expanded, so the page opens at once
+# whatever the number of models.
+
+import argparse
+import html
+import json
+import os
+import sys
+
+###### Settings go here ######
+
+reportName      = 'report.html'
+
+significantDigits = 5
+
+###### Don't edit below here ######
+
+def compact(value):
+    '''JSON-friendly number rounded to significantDigits (None for NaN)'''
+    value = float(value)
+    if value != value or value in (float('inf'), float('-inf')):
+        return None
+    return float(f'{value:.{significantDigits}g}')
+
+def stats_tables(dirPath, pipeline):
+    '''{file name: stats table} of a run set, computed or refreshed by
+    calc_and_plot when stale and read from the stats csv files otherwise'''
+    import glob
+    import pandas as pd
+
+    fresh = pipeline.calc_and_plot(dirPath, plots=False)
+    tables = {os.path.splitext(os.path.basename(path))[0]: table for path, table in fresh.items()}
+    statsDir = os.path.join(dirPath, 'stats', pipeline.rawDataFileName)
+    for searchAttrs in pipeline.searchAttrsList:
+        for path in sorted(glob.glob(os.path.join(glob.escape(statsDir), searchAttrs['output'] + '*.csv'))):
+            fileName = os.path.splitext(os.path.basename(path))[0]
+            if fileName not in tables:
+                tables[fileName] = pd.read_csv(path)
+    return tables
+
+def figure_data(table, xaxisLabel, keyLabel, metrics):
+    '''Pre-aggregated series of one stats table: for every metric and key
+    the x values with [mean, C.I. lower, C.I. upper]'''
+    from statsEngine import shape_stats
+
+    metrics = [m for m in metrics if f'{m}_Mean' in table.columns]
+    shaped = shape_stats(table, xaxisLabel, keyLabel, metrics)
+    series = {}
+    for key, data in shaped.items():
+        series[str(key)] = {'x': [x.item() if hasattr(x, 'item') else x for x in data['x']]}
+        for metric in metrics:
+            stats = data[metric]
+            series[str(key)][metric] = [[compact(m), compact(lo), compact(hi)] for m, lo, hi in
+                                        zip(stats['Mean'], stats['CI_Lower'], stats['CI_Upper'])]
+    return {'metrics': metrics, 'series': series}
+
+def model_data(dirPath, pipeline):
+    '''Embedded data of one model: its figures grouped by stats file'''
+    metrics = [param['name'] for param in pipeline.metricList]
+    tables = stats_tables(dirPath, pipeline)
+    figures = []
+    for searchAttrs in pipeline.searchAttrsList:
+        xaxisLabel, keyLabel = searchAttrs['groupby'][0], searchAttrs['filter']
+        for fileName in sorted(tables):
+            if not fileName.startswith(searchAttrs['output']):
+                continue
+            filterValue = fileName[len(searchAttrs['output']):]
+            figure = figure_data(tables[fileName], xaxisLabel, keyLabel, metrics)
+            figure.update(title=f"{keyLabel} = {filterValue}", x=xaxisLabel, key=keyLabel)
+            figures.append(figure)
+    return figures
+
+def find_campaigns(path):
+    '''{campaign directory: [model run set directories]} below path'''
+    from campaignCatalog import find_run_sets
+
+    campaigns = {}
+    for dirPath in find_run_sets(path):
+        if os.path.exists(os.path.join(dirPath, 'scheduleq.csv')):
+            campaigns.setdefault(os.path.dirname(dirPath), []).append(dirPath)
+    return {c: sorted(models) for c, models in sorted(campaigns.items())}
+
+pageStyle = '''
+body { font-family: sans-serif; margin: 2em; color: #222; }
+h1 { font-size: 1.5em; } details { margin: .4em 0; }
+summary { cursor: pointer; font-weight: bold; padding: .3em; background: #f0f0f0; }
+.note { color: #888; font-weight: normal; }
+.figure { display: inline-block; margin: .5em; vertical-align: top; }
+.figure h4 { margin: .2em 0; font-size: .9em; }
+svg text { font-size: 11px; } .error { color: #a00; }
+'''
+
+pageScript = '''
+const colors = ["#1f77b4","#ff7f0e","#2ca02c","#d62728","#9467bd","#8c564b","#e377c2","#7f7f7f"];
+const NS = "http://www.w3.org/2000/svg";
+function el(tag, attrs, parent, text) {
+  const e = document.createElementNS(NS, tag);
+  for (const k in attrs) e.setAttribute(k, attrs[k]);
+  if (text !== undefined) e.textContent = text;
+  if (parent) parent.appendChild(e);
+  return e;
+}
+function fmt(v) {
+  const a = Math.abs(v);
+  return a >= 1e6 ? (v / 1e6).toFixed(1) + "M" : a >= 1e3 ? (v / 1e3).toFixed(1) + "K" : +v.toPrecision(3);
+}
+function chart(figure, metric) {
+  const W = 420, H = 260, L = 55, R = 110, T = 10, B = 35;
+  const keys = Object.keys(figure.series);
+  const xs = [...new Set(keys.flatMap(k => figure.series[k].x))];
+  const numeric = xs.every(x => typeof x === "number");
+  if (numeric) xs.sort((a, b) => a - b);
+  const xpos = x => numeric && xs.length > 1 ? (x - xs[0]) / (xs[xs.length - 1] - xs[0]) : (xs.length > 1 ? xs.indexOf(x) / (xs.length - 1) : .5);
+  let lo = Infinity, hi = -Infinity;
+  for (const k of keys) for (const p of figure.series[k][metric]) for (const v of p) if (v !== null) { lo = Math.min(lo, v); hi = Math.max(hi, v); }
+  if (!isFinite(lo)) { lo = 0; hi = 1; }
+  if (lo === hi) { lo -= 1; hi += 1; }
+  const pad = (hi - lo) * .05; lo -= pad; hi += pad;
+  const X = x => L + xpos(x) * (W - L - R), Y = v => T + (1 - (v - lo) / (hi - lo)) * (H - T - B);
+  const svg = el("svg", {width: W, height: H});
+  el("line", {x1: L, y1: H - B, x2: W - R, y2: H - B, stroke: "#444"}, svg);
+  el("line", {x1: L, y1: T, x2: L, y2: H - B, stroke: "#444"}, svg);
+  for (let i = 0; i <= 4; i++) {
+    const v = lo + (hi - lo) * i / 4;
+    el("line", {x1: L, y1: Y(v), x2: W - R, y2: Y(v), stroke: "#eee"}, svg);
+    el("text", {x: L - 4, y: Y(v) + 4, "text-anchor": "end"}, svg, fmt(v));
+  }
+  for (const x of xs) el("text", {x: X(x), y: H - B + 14, "text-anchor": "middle"}, svg, x);
+  el("text", {x: (L + W - R) / 2, y: H - 4, "text-anchor": "middle"}, svg, figure.x);
+  keys.forEach((k, i) => {
+    const s = figure.series[k], c = colors[i % colors.length];
+    const pts = s.x.map((x, j) => [X(x), s[metric][j]]).filter(p => p[1][0] !== null);
+    el("polyline", {points: pts.map(p => p[0] + "," + Y(p[1][0])).join(" "), fill: "none", stroke: c}, svg);
+    for (const [px, v] of pts) {
+      if (v[1] !== null && v[2] !== null) el("line", {x1: px, y1: Y(v[1]), x2: px, y2: Y(v[2]), stroke: c}, svg);
+      el("circle", {cx: px, cy: Y(v[0]), r: 2.5, fill: c}, el("g", {}, svg))
+        .appendChild(el("title", {}, null, `${k}: ${v[0]} [${v[1]}, ${v[2]}]`));
+    }
+    el("rect", {x: W - R + 8, y: T + i * 16, width: 10, height: 10, fill: c}, svg);
+    el("text", {x: W - R + 22, y: T + i * 16 + 9}, svg, k);
+  });
+  return svg;
+}
+function draw(section) {
+  const figures = JSON.parse(document.getElementById(section.dataset.source).textContent);
+  const body = section.querySelector(".body");
+  for (const figure of figures) for (const metric of figure.metrics) {
+    const box = document.createElement("div");
+    box.className = "figure";
+    box.innerHTML = "<h4></h4>";
+    box.firstChild.textContent = metric + " (" + figure.title + ", C.I. 95%)";
+    box.appendChild(chart(figure, metric));
+    body.appendChild(box);
+  }
+}
+document.addEventListener("toggle", e => {
+  const section = e.target;
+  if (section.open && section.dataset.source && !section.dataset.drawn) {
+    section.dataset.drawn = "1";
+    draw(section);
+  }
+}, true);
+'''
+
+def write_report(campaignDir, modelDirs, pipeline, outFile=None):
+    '''Writes the report of one campaign; returns its path'''
+    from stageTrace import stage
+
+    outFile = outFile or os.path.join(campaignDir, reportName)
+    title = os.path.basename(os.path.normpath(campaignDir)) or campaignDir
+    sections = []
+    for i, dirPath in enumerate(modelDirs):
+        name = html.escape(os.path.basename(dirPath))
+        try:
+            with stage('report', dir=dirPath):
+                figures = model_data(dirPath, pipeline)
+        except (Exception, SystemExit) as err:     # a model without data keeps its section
+            reason = html.escape(f'{type(err).__name__}: {err}')
+            sections.append(f'<details><summary>{name} <span class="note">no stats</span></summary>'
+                            f'<p class="error">{reason}</p></details>')
+            continue
+        # JSON inside a non-executed script element: parsed only on expansion
+        data = json.dumps(figures, separators=(',', ':')).replace('</', '<\\/')
+        count = sum(len(f['metrics']) for f in figures)
+        sections.append(f'<script type="application/json" id="data-{i}">{data}</script>\n'
+                        f'<details data-source="data-{i}"><summary>{name} '
+                        f'<span class="note">{count} charts</span></summary><div class="body"></div></details>')
+
+    page = (f'<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>{html.escape(title)}</title>'
+            f'<style>{pageStyle}</style></head><body>\n<h1>{html.escape(title)}</h1>\n'
+            + '\n'.join(sections) + f'\n<script>{pageScript}</script>\n</body></html>\n')
+    tmpPath = f'{outFile}.{os.getpid()}.tmp'
+    with open(tmpPath, 'w') as fp:
+        fp.write(page)
+    os.replace(tmpPath, outFile)
+    return outFile
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Write a self-contained HTML report per campaign")
+    parser.add_argument("path", help="Campaign directory, or a results tree with several (e.g., 'completed_logs')")
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    if not os.path.isdir(args.path):
+        print('Invalid path to source')
+        sys.exit(1)
+
+    import matplotlib
+    matplotlib.use('Agg')
+    import temp as pipeline
+
+    campaigns = find_campaigns(args.path)
+    if not campaigns:
+        print(f"No run sets with a scheduleq.csv below '{args.path}'")
+        sys.exit(1)
+    for campaignDir, modelDirs in campaigns.items():
+        outFile = write_report(campaignDir, modelDirs, pipeline)
+        print(f"{outFile}: {len(modelDirs)} models")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+# Reports the start-up time of the plotting entry points and checks it
+# against a budget
+#
+# Every entry point is run with --help in a fresh interpreter, repeats times;
+# the median wall time above a bare interpreter start is its start-up cost.
+# Importing an entry point must not load any of heavyModules either, since
+# those are deferred to the stage that needs them. Exits non-zero when an
+# entry point is over budget or imports a heavy module at load time.
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+###### Settings go here ######
+
+entryPoints     = [ 'plotScheduleQ.py',
+                    'temp.py',
+                    'plotCombined.py',
+                    'customPlot.py',
+                    'customOverallplot.py',
+                    'campaignCatalog.py',
+                    'watchPlots.py',
+                    'branchRegression.py',
+                    'campaignReport.py',
+                    'baselineStore.py',
+                    'repetitionPlanner.py',
+                    'derivedMetrics.py',
+                    'plotAll.py',
+                  ]
+
+heavyModules    = ['numpy', 'pandas', 'scipy', 'matplotlib', 'seaborn', 'pyarrow']
+
+budgetSecs      = 0.15      # start-up cost per entry point, above a bare interpreter
+repeats         = 5
+
+###### Don't edit below here ######
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+def wall_time(command):
+    '''Median wall time of running command, in seconds'''
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=here, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, check=False)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+def heavy_imports(script):
+    '''Heavy modules loaded by importing script without running it'''
+    module = os.path.splitext(script)[0]
+    code = (f"import sys; import {module}; "
+            f"print(' '.join(m for m in {heavyModules!r} if m in sys.modules))")
+    out = subprocess.run([sys.executable, '-c', code], cwd=here,
+                         capture_output=True, text=True, check=True)
+    return out.stdout.split()
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Report and check the start-up time of the entry points")
+    parser.add_argument("scripts", nargs='*', default=entryPoints,
+                        help="Entry points to check (default: all)")
+    parser.add_argument("--budget", type=float, default=budgetSecs,
+                        help="Start-up budget in seconds above a bare interpreter (default: %(default)s)")
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    bare = wall_time([sys.executable, '-c', 'pass'])
+    print(f"{'interpreter':24s} {bare * 1000:8.1f} ms")
+
+    failures = 0
+    for script in args.scripts:
+        cost = wall_time([sys.executable, script, '--help']) - bare
+        heavy = heavy_imports(script)
+        ok = cost <= args.budget and not heavy
+        failures += not ok
+        note = f"  imports {', '.join(heavy)}" if heavy else ''
+        print(f"{script:24s} {cost * 1000:+8.1f} ms  {'ok' if ok else 'OVER'}{note}")
+
+    print(f"budget {args.budget * 1000:.0f} ms, {failures} failing")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,12 @@
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 import os
 import argparse
-from matplotlib.ticker import FuncFormatter
 import glob
+from campaignCatalog import run_files, skipDirs
+from derivedMetrics import config_columns, derive_configs
+from stageTrace import stage
 
-# Use a basic style that should be available in all matplotlib installations
-plt.style.use('default')
-
-# Set seaborn style manually
-sns.set_style("whitegrid")
-sns.set_palette("deep")
+# pandas, matplotlib and seaborn are imported (and styled) when the first
+# plot is made, so argument parsing returns immediately
 
 colors = ["#ff9999", "#66b3ff", "#99ff99", "#ffcc99", "#ff99cc", "#99ffff", "#ff99ff", "#ffff99"]
 
@@ -50,83 +45,196 @@ plot_configs = [
     },
 ]
 
-def create_unified_plot(dataframes, config, output_dir):
-    plt.figure(figsize=(16, 10))
-    ax = plt.gca()
+def set_style():
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    # Use a basic style that should be available in all matplotlib installations
+    plt.style.use('default')
+
+    # Set seaborn style manually
+    sns.set_style("whitegrid")
+    sns.set_palette("deep")
+
+# Aggregations that can be combined from the shared per-group partials
+partialAggs     = {'sum': 'sum', 'count': 'sum', 'min': 'min', 'max': 'max'}
+
+def unique(values):
+    return list(dict.fromkeys(values))
+
+def y_columns(config):
+    return config['y'] if isinstance(config['y'], list) else [config['y']]
+
+def aggregate_configs(frame, configs):
+    '''Aggregated data of every config, keyed by title, from one grouped
+    pass over frame: sums, counts, minima and maxima per Model x grouping x
+    x-axis value, which each config then reduces to its own keys'''
+    import pandas as pd
 
-    all_handles = []
-    all_labels = []
+    keys = unique(['Model'] + [c for config in configs for c in (config['groupby'], config['x'])])
+    values = unique(y for config in configs for y in y_columns(config))
+    with stage('stats', figure='shared'):
+        partial = frame.groupby(keys, observed=True, sort=True)[values].agg(['sum', 'count', 'min', 'max'])
+
+    grouped = {}
+    for config in configs:
+        configKeys = unique(['Model', config['groupby'], config['x']])
+        agg = config['agg']
+        with stage('stats', figure=config['title']):
+            if agg == 'mean' or agg in partialAggs:
+                reduce = lambda stat, how: partial[stat].groupby(level=configKeys, observed=True,
+                                                                 sort=True).agg(how)
+                result = {}
+                for y in y_columns(config):
+                    if agg == 'mean':
+                        result[y] = reduce((y, 'sum'), 'sum') / reduce((y, 'count'), 'sum')
+                    else:
+                        result[y] = reduce((y, agg), partialAggs[agg])
+                data = pd.concat(result, axis=1)
+            else:
+                # Not combinable from the partials (e.g. median): group the rows
+                data = frame.groupby(configKeys, observed=True, sort=True)[y_columns(config)].agg(agg)
+        grouped[config['title']] = data.reset_index()
+    return grouped
+
+def create_unified_plot(grouped_data, config, output_dir):
+    '''Draws one config from its aggregated data (see aggregate_configs)'''
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    from matplotlib.patches import Patch
+    from matplotlib.ticker import FuncFormatter
+
+    with stage('render', dir=output_dir, figure=config['title']):
+        plt.figure(figsize=(16, 10))
+        ax = plt.gca()
+
+        # One hue level per model and branch, in model order
+        data = grouped_data.copy()
+        labels = data['Model'].astype(str) + ' - ' + data[config['groupby']].astype(str)
+        levels = unique(labels)
+        data['Model - ' + config['groupby']] = labels
+        palette = [colors[k % len(colors)] for k in range(len(levels))]
 
-    for i, (model, df) in enumerate(dataframes.items()):
-        grouped_data = df.groupby([config['groupby'], config['x']])[config['y']].agg(config['agg']).reset_index()
-        
         if config['type'] == 'bar':
-            sns.barplot(x=config['x'], y=config['y'], hue=config['groupby'], data=grouped_data, 
-                        palette=colors[i*2:(i+1)*2], alpha=0.7, ax=ax)
-            handles, labels = ax.get_legend_handles_labels()
-            new_labels = [f"{model} - {label}" for label in labels]
-            all_handles.extend(handles)
-            all_labels.extend(new_labels)
-            ax.legend().remove()  # Remove the current legend to avoid duplicates
-        
+            # Dodge by branch, then colour every bar by its model and branch
+            branches = unique(data[config['groupby']].astype(str))
+            xs = unique(data[config['x']].astype(str))
+            sns.barplot(x=config['x'], y=config['y'], hue=config['groupby'], data=data,
+                        hue_order=branches, order=xs, alpha=0.7, ax=ax)
+            # Models behind each x x branch bar; x need not be Model
+            bar_models = {}
+            for x, branch, model in zip(data[config['x']].astype(str),
+                                        data[config['groupby']].astype(str),
+                                        data['Model'].astype(str)):
+                bar_models.setdefault((x, branch), set()).add(model)
+            for j, container in enumerate(ax.containers):
+                for bar in container:
+                    # Missing x x branch bars are skipped: locate by position
+                    x = xs[int(round(bar.get_x() + bar.get_width() / 2))]
+                    models = bar_models.get((x, branches[j]), set())
+                    # A bar averaging several models keeps its branch colour
+                    if len(models) == 1:
+                        label = f"{next(iter(models))} - {branches[j]}"
+                        bar.set_facecolor(palette[levels.index(label)])
+            handles = [Patch(facecolor=palette[k], alpha=0.7) for k in range(len(levels))]
+
         elif config['type'] == 'line':
-            sns.lineplot(x=config['x'], y=config['y'], hue=config['groupby'], data=grouped_data, 
-                         marker='o', palette=colors[i*2:(i+1)*2], ax=ax)
-            handles, labels = ax.get_legend_handles_labels()
-            new_labels = [f"{model} - {label}" for label in labels]
-            all_handles.extend(handles[len(all_handles):])  # Add only new handles
-            all_labels.extend(new_labels[len(all_labels):])  # Add only new labels
-            ax.legend().remove()  # Remove the current legend to avoid duplicates
-
-    plt.title(config['title'], fontsize=20, fontweight='bold', pad=20)
-    plt.xlabel(config['x'], fontsize=14, labelpad=10)
-    plt.ylabel(config['y'], fontsize=14, labelpad=10)
+            sns.lineplot(x=config['x'], y=config['y'], hue='Model - ' + config['groupby'],
+                         hue_order=levels, data=data, marker='o', palette=palette, ax=ax)
+            handles, _ = ax.get_legend_handles_labels()
+
+        plt.title(config['title'], fontsize=20, fontweight='bold', pad=20)
+        plt.xlabel(config['x'], fontsize=14, labelpad=10)
+        plt.ylabel(config['y'], fontsize=14, labelpad=10)
     
-    ax.yaxis.set_major_formatter(FuncFormatter(format_y_axis))
+        ax.yaxis.set_major_formatter(FuncFormatter(format_y_axis))
     
-    if len(grouped_data[config['x']].unique()) > 10:
-        plt.xticks(rotation=45, ha='right')
+        if len(data[config['x']].unique()) > 10:
+            plt.xticks(rotation=45, ha='right')
 
-    ax.legend(all_handles, all_labels, title='Model - ' + config['groupby'], 
-              title_fontsize='13', fontsize='11', bbox_to_anchor=(1.05, 1), loc='upper left')
+        ax.legend(handles, levels, title='Model - ' + config['groupby'],
+                  title_fontsize='13', fontsize='11', bbox_to_anchor=(1.05, 1), loc='upper left')
+
+        plt.grid(True, linestyle='--', alpha=0.7)
+        plt.tight_layout()
 
-    plt.grid(True, linestyle='--', alpha=0.7)
-    plt.tight_layout()
-    
     filename = f"Unified_{config['title'].replace(' ', '_')}.png"
-    plt.savefig(os.path.join(output_dir, filename), dpi=300, bbox_inches='tight')
+    with stage('convert', dir=output_dir, figure=config['title']):
+        plt.savefig(os.path.join(output_dir, filename), dpi=300, bbox_inches='tight')
     plt.close()
 
+def load_unified_frame(run_sets, columns, configs=(), read=None):
+    '''One frame of the given columns of every (model name, csv) run set,
+    with Model and every label column as categoricals, plus the derived
+    metrics configs plot (each run set against its own baselines).
+    read(path, columns) replaces read_raw when given.'''
+    import pandas as pd
+    from rawSchema import read_raw
+
+    frames = []
+    for model_name, path in run_sets:
+        with stage('load', dir=os.path.dirname(path)):
+            df = (read or read_raw)(path, [c for c in columns if c != 'Model'])
+        with stage('derive', dir=os.path.dirname(path)):
+            df = derive_configs(df, configs, os.path.dirname(path))
+        frames.append(df.assign(Model=model_name))
+    frame = pd.concat(frames, ignore_index=True)
+
+    # Categories differ between files; unify them after the concatenation
+    frame['Model'] = pd.Categorical(frame['Model'], categories=unique(m for m, _ in run_sets))
+    for column in frame.columns:
+        if column != 'Model' and frame[column].dtype == object:
+            frame[column] = frame[column].astype('category')
+    return frame
+
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description="Generate unified plots from multiple CSV files")
     parser.add_argument("input_pattern", help="Glob pattern for directories containing CSV files (e.g., 'path/to/*')")
     return parser.parse_args()
 
-def main():
-    args = parse_arguments()
-    
-    # Get the parent directory of the input pattern
-    parent_dir = os.path.dirname(args.input_pattern)
+def generate_unified_plots(input_pattern, read=None):
+    # Get the parent directory of the input pattern; with a pattern over
+    # several campaigns (e.g. 'completed_logs/*/*') the directory above them
+    parent_dir = os.path.dirname(input_pattern)
+    while glob.has_magic(parent_dir):
+        parent_dir = os.path.dirname(parent_dir)
     
     # Set the output directory to be the parent directory
     output_dir = parent_dir
     os.makedirs(output_dir, exist_ok=True)
     
-    dataframes = {}
-    for input_dir in glob.glob(args.input_pattern):
-        if os.path.isdir(input_dir):
-            model_name = os.path.basename(input_dir)
-            csv_file = next((f for f in os.listdir(input_dir) if f.endswith('.csv')), None)
-            if csv_file:
-                df = pd.read_csv(os.path.join(input_dir, csv_file))
-                df['Model'] = model_name  # Add a column to identify the model
-                dataframes[model_name] = df
-    
-    for config in plot_configs:
-        create_unified_plot(dataframes, config, output_dir)
+    # Run sets matching the pattern, found read-only: plotting writes no
+    # catalog or run log index (concurrent tasks would race on them)
+    run_sets = []
+    for path in sorted(glob.glob(input_pattern)):
+        path = os.path.normpath(os.path.abspath(path))
+        if not os.path.isdir(path) or os.path.basename(path) in skipDirs:
+            continue
+        csv_file = run_files(path)[0]
+        if csv_file:
+            run_sets.append((os.path.basename(path), csv_file))
+
+    if not run_sets:
+        print(f"No run sets match '{input_pattern}'")
+        return
+
+    # One load and one grouped pass for every config
+    frame = load_unified_frame(run_sets, config_columns(plot_configs), plot_configs, read)
+    grouped = aggregate_configs(frame, plot_configs)
+
+    # Drawn across the render pool with the style set here
+    from renderPool import render_all
+    set_style()
+    render_all([(create_unified_plot, (grouped[config['title']], config, output_dir))
+                for config in plot_configs])
     
     print(f"All unified plots have been generated and saved in the '{output_dir}' directory.")
 
+def main():
+    args = parse_arguments()
+    with stage('directory', dir=args.input_pattern):
+        generate_unified_plots(args.input_pattern)
+
 if __name__ == "__main__":
     main()
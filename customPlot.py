@@ -1,9 +1,11 @@
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 import os
 import argparse
 import glob
+from derivedMetrics import config_columns, derive_configs
+from stageTrace import stage
+
+# pandas, matplotlib and seaborn are imported when the first plot is made,
+# so argument parsing and empty directories return immediately
 
 # List of plot configurations
 plot_configs = [
@@ -34,57 +36,86 @@ plot_configs = [
     # Add more configurations as needed
 ]
 
-def create_plot(df, config, output_dir):
+def aggregate(df, config, output_dir):
     # Group and aggregate data
-    grouped_data = df.groupby([config['groupby'], config['x']])[config['y']].agg(config['agg']).reset_index()
-    
+    with stage('stats', dir=output_dir, figure=config['title']):
+        return df.groupby([config['groupby'], config['x']])[config['y']].agg(config['agg']).reset_index()
+
+def plot_file(config, output_dir):
+    return os.path.join(output_dir, f"{config['title'].replace(' ', '_')}.png")
+
+def draw_plot(grouped_data, config, output_dir):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
     # Create plot
-    plt.figure(figsize=(12, 6))
-    if config['type'] == 'bar':
-        sns.barplot(x=config['x'], y=config['y'], hue=config['groupby'], data=grouped_data)
-    elif config['type'] == 'line':
-        sns.lineplot(x=config['x'], y=config['y'], hue=config['groupby'], data=grouped_data, marker='o')
-    
-    plt.title(config['title'])
-    plt.xlabel(config['x'])
-    plt.ylabel(config['y'])
-    plt.legend(title=config['groupby'])
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-    
+    with stage('render', dir=output_dir, figure=config['title']):
+        plt.figure(figsize=(12, 6))
+        if config['type'] == 'bar':
+            sns.barplot(x=config['x'], y=config['y'], hue=config['groupby'], data=grouped_data)
+        elif config['type'] == 'line':
+            sns.lineplot(x=config['x'], y=config['y'], hue=config['groupby'], data=grouped_data, marker='o')
+
+        plt.title(config['title'])
+        plt.xlabel(config['x'])
+        plt.ylabel(config['y'])
+        plt.legend(title=config['groupby'])
+        plt.xticks(rotation=45)
+        plt.tight_layout()
+
     # Save the plot
-    filename = f"{config['title'].replace(' ', '_')}.png"
-    plt.savefig(os.path.join(output_dir, filename))
+    with stage('convert', dir=output_dir, figure=config['title']):
+        plt.savefig(plot_file(config, output_dir))
     plt.close()
 
+def create_plot(df, config, output_dir):
+    draw_plot(aggregate(df, config, output_dir), config, output_dir)
+
 def parse_arguments():
     parser = argparse.ArgumentParser(description="Generate plots from CSV data in a folder")
     parser.add_argument("input_folder", help="Path to the input folder containing CSV files")
     return parser.parse_args()
 
-def main():
-    # Parse command-line arguments
-    args = parse_arguments()
-    
+def generate_plots(input_folder, read=None):
+    # read(path, columns) replaces read_raw, e.g. to take the rows from a
+    # frame already loaded (plotAll.py)
     # Create output directory as a subdirectory of the input folder
-    output_dir = os.path.join(args.input_folder, 'output_plots')
+    output_dir = os.path.join(input_folder, 'output_plots')
     os.makedirs(output_dir, exist_ok=True)
     
     # Look for all CSV files in the specified folder
-    csv_files = glob.glob(os.path.join(args.input_folder, '*.csv'))
+    csv_files = glob.glob(os.path.join(input_folder, '*.csv'))
     
     if not csv_files:
-        print(f"No CSV files found in the directory '{args.input_folder}'")
+        print(f"No CSV files found in the directory '{input_folder}'")
         return
+
+    from rawSchema import read_raw
+    from renderPool import render_all
     
-    # Create plots for each CSV file found
+    # Aggregate every config of each CSV file found, then draw the figures
+    # across the render pool. Files write the same figure names, so only
+    # the last file's figure of each name is drawn, as before.
+    jobs = {}
     for csv_file in csv_files:
-        df = pd.read_csv(csv_file)
+        with stage('load', dir=input_folder):
+            df = (read or read_raw)(csv_file, config_columns(plot_configs))
+        with stage('derive', dir=input_folder):
+            df = derive_configs(df, plot_configs, input_folder)
         print(f"Processing {csv_file}")
         for config in plot_configs:
-            create_plot(df, config, output_dir)
+            jobs.pop(plot_file(config, output_dir), None)
+            jobs[plot_file(config, output_dir)] = (draw_plot, (aggregate(df, config, output_dir),
+                                                               config, output_dir))
+    render_all(list(jobs.values()))
     
     print(f"All plots have been generated and saved in the '{output_dir}' directory.")
 
+def main():
+    # Parse command-line arguments
+    args = parse_arguments()
+    with stage('directory', dir=args.input_folder):
+        generate_plots(args.input_folder)
+
 if __name__ == "__main__":
     main()
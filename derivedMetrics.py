@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+
+# Registry of the metrics derived from the raw csv columns
+#
+#     python derivedMetrics.py              lists every metric and its inputs
+#
+#     data = derive(data, ['Speedup_w.r.t._Sequential_Simulation'], workloads)
+#
+# A derived metric is an expression over columns written as {Column_Name};
+# the columns may be raw (see variables) or derived themselves. The inputs of
+# a metric are read from its expression, so asking for a metric also derives
+# what it depends on, and raw_inputs() lists the raw columns to load for a set
+# of metrics. Only the requested metrics and their dependencies are computed:
+# one pass evaluates them in dependency order on float64 arrays of the frame
+# (so sums of uint32 counters cannot wrap) and adds them in one assignment.
+#
+# Sequential_Seconds, the baseline time of the row's workload (see
+# baselineStore.py), comes from the workloads passed in; without them it is
+# NaN, and so is every metric over it.
+#
+# The frame records in frame.attrs which expression (and baselines) produced
+# each derived column, and filtered frames inherit the record. Deriving a
+# metric the frame already holds is free, so scripts handed the same frame
+# derive it once, and again only when its definition changes.
+#
+# The plot configurations of customPlot.py and customOverallplot.py name
+# their metrics in 'y'; config_columns() and derive_configs() load and derive
+# what they plot.
+
+import argparse
+import re
+
+###### Settings go here ######
+
+derivedMetrics  =   {   'Event_Commitment_Ratio'
+                            : '{Events_Processed} / {Events_Committed}',
+                        'Total_Rollbacks'
+                            : '{Primary_Rollbacks} + {Secondary_Rollbacks}',
+                        'Event_Processing_Rate_(per_sec)'
+                            : '{Events_Processed} / {Simulation_Runtime_(secs.)}',
+                        'Speedup_w.r.t._Sequential_Simulation'
+                            : '{Sequential_Seconds} / {Simulation_Runtime_(secs.)}',
+
+                        # Per LP
+                        'Events_Processed_per_LP'
+                            : '{Events_Processed} / {Number_of_Objects}',
+                        'Rollbacks_per_LP'
+                            : '{Total_Rollbacks} / {Number_of_Objects}',
+
+                        # Per worker thread
+                        'Event_Processing_Rate_per_Thread'
+                            : '{Event_Processing_Rate_(per_sec)} / {Worker_Thread_Count}',
+                        'Speedup_per_Thread'
+                            : '{Speedup_w.r.t._Sequential_Simulation} / {Worker_Thread_Count}',
+
+                        # Share of the sent events that went to another node
+                        'Total_Events_Sent'
+                            : '{Local_Positive_Events_Sent} + {Remote_Positive_Events_Sent} + '
+                              '{Local_Negative_Events_Sent} + {Remote_Negative_Events_Sent}',
+                        'Remote_Event_Ratio'
+                            : '({Remote_Positive_Events_Sent} + {Remote_Negative_Events_Sent})'
+                              ' / {Total_Events_Sent}'
+                    }
+
+###### Don't edit below here ######
+
+baselineColumn  = 'Sequential_Seconds'
+baselineInputs  = ['Model', 'Number_of_Objects', 'Events_Committed']
+
+columnPattern   = re.compile(r'\{([^{}]+)\}')
+_compiled       = {}
+
+
+def inputs(name):
+    '''Columns the expression of a derived metric reads, in order'''
+    if name == baselineColumn:
+        return list(baselineInputs)
+    return list(dict.fromkeys(columnPattern.findall(derivedMetrics[name])))
+
+def is_derived(name):
+    return name == baselineColumn or name in derivedMetrics
+
+def resolve(names):
+    '''Derived metrics needed for names (their dependencies first)'''
+    order, visiting = [], set()
+
+    def visit(name):
+        if name in order or not is_derived(name):
+            return
+        if name in visiting:
+            raise ValueError(f'derived metric {name} depends on itself')
+        visiting.add(name)
+        for column in inputs(name):
+            visit(column)
+        visiting.discard(name)
+        order.append(name)
+
+    for name in names:
+        visit(name)
+    return order
+
+def raw_inputs(names):
+    '''Raw columns to load to have names: the raw ones among names plus the
+    inputs of the derived ones'''
+    columns = [name for name in names if not is_derived(name)]
+    for name in resolve(names):
+        columns += [c for c in inputs(name) if not is_derived(c)]
+    return list(dict.fromkeys(columns))
+
+def needs_workloads(names):
+    '''Whether any of names depends on the sequential baselines'''
+    return baselineColumn in resolve(names)
+
+def compiled(name):
+    # {Column} becomes a lookup in the arrays of the pass
+    if name not in _compiled:
+        source = columnPattern.sub(lambda m: f'_v[{m.group(1)!r}]', derivedMetrics[name])
+        _compiled[name] = compile(source, f'<derived {name}>', 'eval')
+    return _compiled[name]
+
+def workloads_key(workloads):
+    if workloads is None or workloads.empty:
+        return None
+    from plotManifest import digest
+    return digest(workloads.reset_index().to_numpy().tolist())
+
+def derive(frame, names, workloads=None):
+    '''Adds the derived metrics among names (and what they need) to frame,
+    in place, skipping those it already holds from the same definitions;
+    returns frame'''
+    import numpy as np
+
+    order = resolve(names)
+    if not order:
+        return frame
+    done = frame.attrs.get('derived', {})
+    keys = {name: workloads_key(workloads) if name == baselineColumn else derivedMetrics[name]
+            for name in order}
+    stale = {name for name in order
+             if name not in frame.columns or name not in done or done[name] != keys[name]}
+    if not stale:
+        return frame
+    # Anything downstream of a stale metric is stale too
+    for name in order:
+        if any(c in stale for c in inputs(name)):
+            stale.add(name)
+
+    values = {}
+
+    def column(name):
+        if name not in values:
+            values[name] = frame[name].to_numpy(dtype='float64')
+        return values[name]
+
+    computed = []
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for name in order:
+            if name not in stale:
+                continue
+            if name == baselineColumn:
+                from baselineStore import baseline_seconds
+                values[name] = baseline_seconds(frame, workloads) if workloads is not None \
+                                   else np.full(len(frame), np.nan)
+            else:
+                arrays = {c: column(c) for c in inputs(name)}
+                values[name] = np.asarray(eval(compiled(name), {'np': np}, {'_v': arrays}),
+                                          dtype='float64')
+            computed.append(name)
+
+    frame[computed] = np.column_stack([values[name] for name in computed]) if len(frame) \
+                          else np.empty((0, len(computed)))
+    frame.attrs['derived'] = {**done, **{name: keys[name] for name in computed}}
+    return frame
+
+def config_metrics(configs):
+    '''Columns the plot configurations plot, raw or derived'''
+    metrics = []
+    for config in configs:
+        metrics += config['y'] if isinstance(config['y'], list) else [config['y']]
+    return list(dict.fromkeys(metrics))
+
+def config_columns(configs):
+    '''Raw columns the plot configurations group by or plot'''
+    columns = set(raw_inputs(config_metrics(configs)))
+    for config in configs:
+        columns.update([config['groupby'], config['x']])
+    return list(columns)
+
+def derive_configs(frame, configs, dirPath):
+    '''Adds the derived metrics the plot configurations plot, against the
+    sequential baselines of dirPath when they need them'''
+    metrics = config_metrics(configs)
+    workloads = None
+    if needs_workloads(metrics):
+        from baselineStore import load_baselines, workload_stats
+        workloads = workload_stats(load_baselines(dirPath))
+    return derive(frame, metrics, workloads)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="List the derived metrics and the raw columns they read")
+    parser.add_argument("metrics", nargs='*', help="Only these metrics (default: all)")
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    names = args.metrics or list(derivedMetrics)
+    for name in names:
+        if name not in derivedMetrics:
+            print(f'{name}: not a derived metric')
+            continue
+        print(name)
+        print(f'    = {derivedMetrics[name]}')
+        print(f"    raw columns: {', '.join(raw_inputs([name]))}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+# Transparent columnar cache for parsed CSV files
+#
+# read_csv_cached() parses a CSV once and stores the typed frame as an
+# uncompressed Arrow/Feather file next to the source (.<name>.feather). Later
+# reads memory-map that file instead of re-parsing the text. The cache is
+# keyed by the source size and mtime, falling back to a content hash when
+# only the mtime changed (e.g. after a copy), and by the read_csv arguments.
+# Without pyarrow, or when a frame cannot be stored, it is a plain read_csv.
+
+import json
+import os
+
+import pandas as pd
+
+from plotManifest import digest, file_digest
+
+###### Settings go here ######
+
+cacheEnabled    = os.environ.get('PLOT_CSV_CACHE', '1') != '0'
+cacheSuffix     = '.feather'
+metadataKey     = b'frameCache'
+
+###### Don't edit below here ######
+
+def cache_path(path):
+    head, tail = os.path.split(path)
+    return os.path.join(head, '.' + tail + cacheSuffix)
+
+def _source_state(path):
+    st = os.stat(path)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+def _load(cacheFile):
+    import pyarrow.feather as feather
+    table = feather.read_table(cacheFile, memory_map=True)
+    meta = json.loads(table.schema.metadata[metadataKey])
+    return table, meta
+
+def _store(cacheFile, frame, meta):
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    table = pa.Table.from_pandas(frame)
+    schemaMeta = dict(table.schema.metadata or {})
+    schemaMeta[metadataKey] = json.dumps(meta).encode()
+    table = table.replace_schema_metadata(schemaMeta)
+    tmpFile = cacheFile + '.tmp'
+    feather.write_feather(table, tmpFile, compression='uncompressed')
+    os.replace(tmpFile, cacheFile)
+
+def read_csv_cached(path, **kwargs):
+    '''pd.read_csv(path, **kwargs) backed by a columnar cache next to path'''
+    if not cacheEnabled:
+        return pd.read_csv(path, **kwargs)
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return pd.read_csv(path, **kwargs)
+
+    cacheFile = cache_path(path)
+    state = _source_state(path)
+    argsKey = digest(kwargs)
+
+    if os.path.exists(cacheFile):
+        try:
+            table, meta = _load(cacheFile)
+            if meta['args'] == argsKey and meta['size'] == state['size']:
+                fresh = meta['mtime_ns'] == state['mtime_ns']
+                if not fresh and meta['sha256'] == file_digest(path):
+                    # Same content with a new mtime: refresh the key only
+                    meta.update(state)
+                    _store(cacheFile, table.to_pandas(), meta)
+                    fresh = True
+                if fresh:
+                    # split_blocks lets numeric columns share the mapped buffers
+                    return table.to_pandas(split_blocks=True)
+        except Exception:
+            pass    # Unreadable or foreign cache file: rebuild it below
+
+    meta = dict(state, args=argsKey, sha256=file_digest(path))
+    frame = pd.read_csv(path, **kwargs)
+    try:
+        _store(cacheFile, frame, meta)
+    except Exception:
+        # e.g. mixed-type object columns that Arrow cannot represent
+        if os.path.exists(cacheFile):
+            os.remove(cacheFile)
+    return frame
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+
+# One entry point for every plot family, parsing each run set once
+#
+#     python plotAll.py all completed_logs -j 4
+#     python plotAll.py stats completed_logs/fossil_20240702003214/pcs-10k
+#
+# Subcommands, over run set directories or the trees above them:
+#     stats       stats csv and error-bar figures (temp.py)
+#     combined    plotScheduleQ.py stats, then the consolidated bar (plotCombined.py)
+#     branch      branch bars and lines per model (customPlot.py)
+#     unified     unified plots of each campaign (customOverallplot.py)
+#     all         the families of runAll
+#
+# The run sets are grouped by campaign (their parent directory); each
+# campaign is one task of the runCampaigns.py runner, so campaigns run in
+# parallel with a timeout. Within a task a Dataset parses each scheduleq.csv
+# on first use with the union of the columns the selected families read,
+# derives the union of their metrics (derivedMetrics.py) and hands every
+# family its columns from that frame. The stats tables plotScheduleQ.py
+# rebuilds go to plotCombined.py in memory (it needs them per thread count,
+# which temp.py's tables, per branch, are not). Up-to-date stats do not ask
+# for the rows, so 'stats' alone does not parse a run set whose manifest is
+# current.
+#
+# temp.py and plotScheduleQ.py write the same stats files under one manifest,
+# so 'stats' and 'combined' are run separately, never in one pass.
+
+import argparse
+import os
+import sys
+import traceback
+
+from campaignCatalog import build_catalog
+from derivedMetrics import config_columns, config_metrics
+from stageTrace import stage
+import customOverallplot
+import customPlot
+import plotCombined
+import plotScheduleQ
+import temp as pipeline
+
+###### Settings go here ######
+
+# Families run by 'all' ('stats' and 'combined' exclude each other)
+runAll          = ['stats', 'branch', 'unified']
+
+###### Don't edit below here ######
+
+families        = ['stats', 'combined', 'branch', 'unified']
+
+
+def family_needs(selected):
+    '''(raw columns, metrics) the selected families read'''
+    columns, metrics = [], []
+    if 'stats' in selected:
+        columns += pipeline.raw_columns()
+        metrics += [param['name'] for param in pipeline.metricList]
+    if 'combined' in selected:
+        columns += plotScheduleQ.raw_columns()
+        metrics += [param['name'] for param in plotScheduleQ.metricList]
+    if 'branch' in selected:
+        columns += config_columns(customPlot.plot_configs)
+        metrics += config_metrics(customPlot.plot_configs)
+    if 'unified' in selected:
+        # Model is the run set's name there, not the csv column
+        columns += [c for c in config_columns(customOverallplot.plot_configs)
+                    if c != 'Model']
+        metrics += config_metrics(customOverallplot.plot_configs)
+    return list(dict.fromkeys(columns)), list(dict.fromkeys(metrics))
+
+
+class Dataset:
+    '''Raw rows of the run sets of one task, each csv parsed once with every
+    column the selected families read, plus their derived metrics'''
+    def __init__(self, selected):
+        self.columns, self.metrics = family_needs(selected)
+        self.frames = {}
+
+    def load(self, path, columns):
+        from baselineStore import load_baselines, workload_stats
+        from derivedMetrics import derive, needs_workloads
+        from rawSchema import check_header, columnTypes, read_raw
+
+        header, _ = check_header(path)
+        wanted = [c for c in columnTypes if c in columns and c in header]
+        with stage('load', dir=os.path.dirname(path)):
+            frame = read_raw(path, wanted)
+        with stage('derive', dir=os.path.dirname(path)):
+            workloads = None
+            if needs_workloads(self.metrics):
+                workloads = workload_stats(load_baselines(os.path.dirname(path),
+                                                          pipeline.baselineRoots))
+            return derive(frame, self.metrics, workloads)
+
+    def read(self, path, columns):
+        '''read_raw(path, columns) served from the shared frame, with the
+        derived metrics it holds'''
+        path = os.path.abspath(path)
+        frame = self.frames.get(path)
+        if frame is None or any(c not in frame.columns for c in columns):
+            # A column nobody announced: parse again with it as well
+            self.columns = list(dict.fromkeys(self.columns + list(columns)))
+            frame = self.frames[path] = self.load(path, self.columns)
+        derived = list(frame.attrs.get('derived', {}))
+        return frame[list(dict.fromkeys(list(columns) + derived))]
+
+    def drop(self, path):
+        self.frames.pop(os.path.abspath(path), None)
+
+
+def attempt(failed, name, func, *args, **kwargs):
+    # A failing family is reported without stopping the others
+    try:
+        return func(*args, **kwargs)
+    except (Exception, SystemExit):
+        traceback.print_exc()
+        failed.append(name)
+
+def run_set(dirPath, selected, dataset, failed):
+    '''The per-run-set families of selected'''
+    if not os.path.exists(os.path.join(dirPath, pipeline.rawDataFileName + '.csv')):
+        print(f'{dirPath}: no {pipeline.rawDataFileName}.csv')
+        return
+    if 'stats' in selected:
+        attempt(failed, f'stats {dirPath}', pipeline.calc_and_plot, dirPath, read=dataset.read)
+    if 'combined' in selected:
+        # plotScheduleQ.py and plotCombined.py take the directory with a separator
+        tables = attempt(failed, f'combined {dirPath}', plotScheduleQ.calc_and_plot,
+                         os.path.join(dirPath, ''), read=dataset.read)
+        if tables is not None:
+            attempt(failed, f'combined {dirPath}', plotCombined.calc_and_plot,
+                    os.path.join(dirPath, ''), tables)
+    if 'branch' in selected:
+        attempt(failed, f'branch {dirPath}', customPlot.generate_plots, dirPath, read=dataset.read)
+
+def run_campaign(campaignDir, runSets, selected):
+    '''Every selected family over the run sets of one campaign, sharing one
+    Dataset'''
+    dataset = Dataset(selected)
+    failed = []
+    for dirPath in runSets:
+        with stage('directory', dir=dirPath):
+            run_set(dirPath, selected, dataset, failed)
+        if 'unified' not in selected:
+            dataset.drop(os.path.join(dirPath, pipeline.rawDataFileName + '.csv'))
+    if 'unified' in selected:
+        attempt(failed, f'unified {campaignDir}', customOverallplot.generate_unified_plots,
+                os.path.join(campaignDir, '*'), read=dataset.read)
+    if failed:
+        raise RuntimeError('failed: ' + ', '.join(failed))
+
+def warm_up(parallel):
+    # Import the heavy modules once in the driver; forked tasks inherit them.
+    # Unlike runCampaigns.warm_up the unified style is left to its own
+    # family, so the other figures look as their scripts draw them.
+    import pandas, matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot, seaborn  # noqa: F401
+    import frameCache, statsEngine  # noqa: F401
+    if parallel:
+        # The tasks already fill the cores: each one renders its figures itself
+        import renderPool
+        renderPool.renderWorkers = 1
+
+def build_tasks(paths, selected):
+    '''One task per campaign with run sets below paths'''
+    from runCampaigns import Task
+
+    paths = [os.path.normpath(os.path.abspath(p)) for p in paths]
+    catalog = build_catalog(paths)
+    campaigns = {}
+    for path in paths:
+        for runSet in catalog.query(under=path):
+            if runSet['scheduleq']:
+                campaignDir = os.path.dirname(runSet['path'])
+                runSets = campaigns.setdefault(campaignDir, [])
+                if runSet['path'] not in runSets:
+                    runSets.append(runSet['path'])
+
+    return [Task(os.path.relpath(campaignDir), run_campaign,
+                 (campaignDir, sorted(runSets), selected))
+            for campaignDir, runSets in sorted(campaigns.items())]
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Generate the stats and every plot family, parsing each run set once")
+    parser.add_argument("family", choices=families + ['all'],
+                        help="Plot family to generate, or 'all'")
+    parser.add_argument("paths", nargs='+',
+                        help="Run set directories or trees above them (e.g., 'completed_logs')")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="Maximum number of campaigns processed at once (default: number of cores)")
+    parser.add_argument("--timeout", type=float, default=0,
+                        help="Per-campaign timeout in seconds, 0 disables it (default: 0)")
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    for path in args.paths:
+        if not os.path.isdir(path):
+            print(f'Invalid path to source: {path}')
+            sys.exit(1)
+
+    selected = runAll if args.family == 'all' else [args.family]
+    if 'stats' in selected and 'combined' in selected:
+        print("'stats' and 'combined' write the same stats files; run them separately")
+        sys.exit(1)
+    tasks = build_tasks(args.paths, selected)
+    if not tasks:
+        print(f"No run sets with a {pipeline.rawDataFileName}.csv below {', '.join(args.paths)}")
+        sys.exit(1)
+
+    from runCampaigns import print_summary, run_tasks
+    warm_up(min(args.jobs, len(tasks)) > 1)
+    failures = run_tasks(tasks, max(1, args.jobs), args.timeout)
+    print_summary(tasks, failures)
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,9 @@
 #!/usr/bin/python
 
+import fnmatch
 import glob
 import os, sys
-import pandas as pd
-import numpy as np
-from matplotlib import pyplot as plt
+from stageTrace import stage
 
 ###### Settings go here ######
 
@@ -50,10 +49,14 @@ solutionList    =   [
 
 ###### Don't edit below here ######
 
-def plotBar(dirPath):
-    # Read dataset
-    statFile = dirPath + 'stats/' + plotDetails['filename'] + '.csv'
-    df = pd.read_csv(statFile)
+def plotBar(dirPath, df=None):
+    import pandas as pd
+    from matplotlib import pyplot as plt
+
+    # Read dataset (unless the consolidated frame is passed in)
+    if df is None:
+        statFile = dirPath + 'stats/' + plotDetails['filename'] + '.csv'
+        df = pd.read_csv(statFile)
 
     xName = plotDetails['xaxis']
     yName = plotDetails['yaxis']
@@ -61,71 +64,100 @@ def plotBar(dirPath):
 
     # Sort data in descending order (if needed)
     if plotDetails['sorted']:
-        df.sort(yName, inplace=True, ascending=False, kind='quicksort')
+        df = df.sort_values(yName, ascending=False, kind='quicksort')
 
     # Retain only the top x% of data
     quantVal = plotDetails['quantile']
     threshold = df[yName].quantile(quantVal)
     df = df[df[yName] >= threshold]
+    if df.empty:
+        # e.g. no sequential baseline, so no speedup
+        print(dirPath + ': no ' + yAxisLabel.lower() + ' values to plot')
+        return
 
     # Build the bar plot
-    quantPert = str(quantVal*100)
-    plotLabel = dirPath.rsplit('/', 2)[-2].replace('_', '-').upper() + ' ' +\
-                                yAxisLabel + ' >= ' + quantPert + 'th percentile'
-    if threadFilter['active']:
-        plotLabel += '\nwith worker thread count = ' + str(threadFilter['value'])
-    ax = df.plot(kind='barh', title=plotLabel, grid=True, legend=False, x=xName, fontsize=5)
-    ax.set_xlabel(yAxisLabel)
-    plt.tight_layout()
+    with stage('render', dir=dirPath):
+        quantPert = str(quantVal*100)
+        plotLabel = dirPath.rsplit('/', 2)[-2].replace('_', '-').upper() + ' ' +\
+                                    yAxisLabel + ' >= ' + quantPert + 'th percentile'
+        if threadFilter['active']:
+            plotLabel += '\nwith worker thread count = ' + str(threadFilter['value'])
+        ax = df.plot(kind='barh', title=plotLabel, grid=True, legend=False, x=xName, fontsize=5)
+        ax.set_xlabel(yAxisLabel)
+        plt.tight_layout()
 
     plotFile = dirPath + 'plots/' + plotDetails['filename'] + '.pdf'
-    plt.savefig(plotFile, width=0.8)
+    with stage('convert', dir=dirPath):
+        plt.savefig(plotFile)
+    plt.close()
+
+
+def consolidate(data, solution, fieldX, fieldY):
+    '''Labels every row of one stats table with its solution name, as column
+    operations. A label seen twice keeps its first position and last value.'''
+    import pandas as pd
+
+    if threadFilter['active']:
+        data = data[data['Worker_Thread_Count'] == threadFilter['value']]
 
+    xValue = pd.Series(solution['label'], index=data.index, dtype=object)
+    for xaxisname, xaxislabel in zip(solution['xaxis'], solution['xlabel']):
+        xValue = xValue + xaxislabel + data[xaxisname].astype(str)
 
-def calc_and_plot(dirPath):
+    yValue = pd.Series(data[fieldY].to_numpy(), index=xValue.to_numpy())
+    yValue = yValue[~yValue.index.duplicated(keep='last')]
+    labels = pd.unique(xValue.to_numpy())
+    return pd.DataFrame({fieldX: labels, fieldY: yValue.reindex(labels).to_numpy()})
+
+def calc_and_plot(dirPath, statsTables=None):
+    '''statsTables optionally maps stats csv paths to in-memory stats tables
+    (as returned by plotScheduleQ.calc_and_plot), used instead of the files'''
+    import pandas as pd
+    from frameCache import read_csv_cached
+
+    statsTables = statsTables or {}
 
     fieldX = plotDetails['xaxis']
     fieldY = plotDetails['yaxis']
 
-    outFile = dirPath + 'stats/' + plotDetails['filename'] + '.csv'
-    statFile = open(outFile,'w')
-    statFile.write(fieldX + ',' + fieldY + '\n')
-    statFile.close()
-
+    results = [pd.DataFrame(columns=[fieldX, fieldY])]
     for solution in solutionList:
         searchPattern = dirPath + solution['search'] + '*'
 
-        for name in glob.glob(searchPattern):
-            if not os.path.exists(name):
+        names = set(glob.glob(searchPattern)) | set(fnmatch.filter(statsTables, searchPattern))
+        for name in sorted(names):
+            if name in statsTables:
+                data = statsTables[name]
+            elif not os.path.exists(name):
                 print(name + ' not available')
                 sys.exit()
+            else:
+                with stage('load', dir=dirPath, figure=name):
+                    data = read_csv_cached(name, sep=',')
 
-            data = pd.read_csv(name, sep=',')
-
-            result = pd.DataFrame(columns=[fieldX, fieldY])
-            for index, row in data.iterrows():
-                if threadFilter['active'] and \
-                        data.at[index,'Worker_Thread_Count'] != threadFilter['value']:
-                    continue
-                yValue = data.at[index,fieldY]
-                xValue = solution['label']
-                for xaxisname, xaxislabel in zip(solution['xaxis'], solution['xlabel']):
-                    xValue = xValue + xaxislabel + str(data.at[index,xaxisname])
-                result.loc[xValue] = [xValue, yValue]
+            with stage('stats', dir=dirPath, figure=name):
+                results.append(consolidate(data, solution, fieldX, fieldY))
 
-            if not result.empty:
-                result.to_csv(outFile, mode='a', index=False, header=False, sep=',')
+    # Write the consolidated frame once
+    result = pd.concat(results, ignore_index=True)
+    outFile = dirPath + 'stats/' + plotDetails['filename'] + '.csv'
+    with stage('write', dir=dirPath):
+        result.to_csv(outFile, index=False, sep=',')
 
-    plotBar(dirPath)
+    plotBar(dirPath, result)
 
 
 def main():
+    if len(sys.argv) != 2 or sys.argv[1] in ('-h', '--help'):
+        print('Usage: python plotCombined.py <path_to_source>')
+        sys.exit(0 if sys.argv[1:] in (['-h'], ['--help']) else 1)
     dirPath = sys.argv[1]
     if not os.path.exists(dirPath):
         print('Invalid path to source')
         sys.exit()
 
-    calc_and_plot(dirPath)
+    with stage('directory', dir=dirPath):
+        calc_and_plot(dirPath)
 
 if __name__ == "__main__":
     main()
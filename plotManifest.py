@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+# Content-hash manifest for incremental stats and plot generation
+#
+# Each output (stats csv or figure) is recorded with the digest of everything
+# it was built from. On the next run an output is rebuilt only if its digest
+# changed or the file is gone, and outputs that are no longer produced are
+# removed instead of wiping the whole stats/plots directories.
+
+import hashlib
+import json
+import os
+
+
+def digest(*parts):
+    '''Stable sha256 of JSON-serializable parts (settings, keys, hashes)'''
+    text = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def file_digest(path, blockSize=1 << 20):
+    '''sha256 of a file's contents, or None if it does not exist'''
+    if not os.path.exists(path):
+        return None
+    h = hashlib.sha256()
+    with open(path, 'rb') as fp:
+        for block in iter(lambda: fp.read(blockSize), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def frame_digest(frame):
+    '''sha256 of a DataFrame's values, independent of its row index'''
+    import pandas as pd
+    rows = pd.util.hash_pandas_object(frame, index=False).to_numpy()
+    h = hashlib.sha256(rows.tobytes())
+    h.update(','.join(map(str, frame.columns)).encode())
+    return h.hexdigest()
+
+def script_version(*paths):
+    '''Digest of the given source files, so code changes invalidate outputs'''
+    return digest(*[file_digest(p) for p in paths])
+
+
+class Manifest:
+    def __init__(self, root, path):
+        self.root = root
+        self.path = path
+        self.inputs = None
+        self.outputs = {}
+        self.current = {}
+        if os.path.exists(path):
+            try:
+                with open(path) as fp:
+                    saved = json.load(fp)
+                self.inputs = saved.get('inputs')
+                self.outputs = saved.get('outputs', {})
+            except (ValueError, OSError):
+                pass    # A corrupt manifest just means a full rebuild
+
+    def _key(self, output):
+        return os.path.relpath(output, self.root)
+
+    def is_current(self, inputsKey):
+        '''True if the inputs are unchanged and every recorded output exists'''
+        return self.inputs == inputsKey and bool(self.outputs) and \
+            all(os.path.exists(os.path.join(self.root, p)) for p in self.outputs)
+
+    def needs_build(self, output, key):
+        return self.outputs.get(self._key(output)) != key or not os.path.exists(output)
+
+    def record(self, output, key):
+        self.current[self._key(output)] = key
+
+    def checkpoint(self):
+        '''Saves the outputs recorded so far next to the previous ones,
+        keeping the previous inputs so the next run still checks every output'''
+        self.outputs = {**self.outputs, **self.current}
+        self.current = {}
+        self._save()
+
+    def invalidate(self, outputs):
+        '''Forgets outputs another writer replaced (e.g. provisional stats),
+        so that the next run rebuilds them'''
+        for output in outputs:
+            self.outputs.pop(self._key(output), None)
+        self.inputs = None
+        self._save()
+
+    def finish(self, inputsKey):
+        '''Removes stale outputs and saves the outputs recorded in this run'''
+        for stale in set(self.outputs) - set(self.current):
+            stalePath = os.path.join(self.root, stale)
+            if os.path.exists(stalePath):
+                os.remove(stalePath)
+        self.inputs = inputsKey
+        self.outputs = self.current
+        self.current = {}
+        self._save()
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmpPath = self.path + '.tmp'
+        with open(tmpPath, 'w') as fp:
+            json.dump({'inputs': self.inputs, 'outputs': self.outputs}, fp, indent=1, sort_keys=True)
+        os.replace(tmpPath, self.path)
@@ -1,19 +1,15 @@
 #!/usr/bin/python
 
 # Calculates statistics and plots the schedule queue metrics from raw data
+#
+# Heavy modules (pandas, scipy, matplotlib) are imported by the stage that
+# needs them, so --help, bad arguments and up-to-date directories return
+# without paying for them
 
 from __future__ import print_function
-import csv
 import os, sys
-import numpy as np
-import scipy as sp
-import scipy.stats as sps
-import pandas as pd
-import re, shutil, tempfile
-import itertools, operator
-import subprocess
-import Gnuplot
-import Gnuplot.funcutils
+import statsPipeline
+from stageTrace import stage
 
 ###### Settings go here ######
 
@@ -32,14 +28,23 @@ searchAttrsList =   [
                     ]
 
 '''
-List of metrics available:
+Metrics available: any numeric raw column (see variables), e.g.
 
-    Event_Commitment_Ratio
-    Total_Rollbacks
     Simulation_Runtime_(secs.)
     Average_Memory_Usage_(MB)
+
+or any derived metric of derivedMetrics.py (python derivedMetrics.py lists
+them with their definitions), e.g.
+
+    Event_Commitment_Ratio
+    Total_Rollbacks
     Event_Processing_Rate_(per_sec)
     Speedup_w.r.t._Sequential_Simulation
+    Event_Processing_Rate_per_Thread
+    Remote_Event_Ratio
+
+Only the derived metrics metricList asks for (and those they are defined over)
+are computed.
 '''
 metricList      =   [
                         {   'name'  : 'Event_Processing_Rate_(per_sec)',
@@ -65,268 +70,64 @@ metricList      =   [
 
 rawDataFileName = 'scheduleq'
 
-statType        = [ 'Mean',
-                    'CI_Lower',
-                    'CI_Upper',
-                    'Median',
-                    'Lower_Quartile',
-                    'Upper_Quartile'
-                  ]
-
-
-###### Don't edit below here ######
-
-def mean_confidence_interval(data, confidence=0.95):
-    # check the input is not empty
-    if not data:
-        raise RuntimeError('mean_ci - no data points passed')
-    a = 1.0*np.array(data)
-    n = len(a)
-    m, se = np.mean(a), sps.sem(a)
-    h = se * sps.t._ppf((1+confidence)/2., n-1)
-    return m, m-h, m+h
-
-def median(data):
-    # check the input is not empty
-    if not data:
-        raise RuntimeError('median - no data points passed')
-    return np.median(np.array(data))
-
-def quartiles(data):
-    # check the input is not empty
-    if not data:
-        raise RuntimeError('quartiles - no data points passed')
-    sorts = sorted(data)
-    mid = len(sorts) / 2
-    if (len(sorts) % 2 == 0):
-        # even
-        lowerQ = median(sorts[:mid])
-        upperQ = median(sorts[mid:])
-    else:
-        # odd
-        lowerQ = median(sorts[:mid])  # same as even
-        upperQ = median(sorts[mid+1:])
-    return lowerQ, upperQ
-
-def statistics(data):
-    # check the input is not empty
-    if not data:
-        raise RuntimeError('statistics - no data points passed')
-
-    mean = ci_lower = ci_upper = med = lower_quartile = upper_quartile = data[0]
-    if len(data) > 1:
-        mean, ci_lower, ci_upper = mean_confidence_interval(data)
-        med = median(data)
-        lower_quartile, upper_quartile = quartiles(data)
-
-    statList = (str(mean), str(ci_lower), str(ci_upper), str(med), str(lower_quartile), str(upper_quartile))
-    return ",".join(statList)
-
-def sed_inplace(filename, pattern, repl):
-    # For efficiency, precompile the passed regular expression.
-    pattern_compiled = re.compile(pattern)
-
-    # For portability, NamedTemporaryFile() defaults to mode "w+b" (i.e., binary
-    # writing with updating). In this case, binary writing imposes non-trivial 
-    # encoding constraints resolved by switching to text writing.
-    with tempfile.NamedTemporaryFile(mode='w', delete=False) as tmp_file:
-        with open(filename) as src_file:
-            for line in src_file:
-                tmp_file.write(pattern_compiled.sub(repl, line))
-
-    # Overwrite the original file with the temporary file in a
-    # manner preserving file attributes (e.g., permissions).
-    shutil.copystat(filename, tmp_file.name)
-    shutil.move(tmp_file.name, filename)
-
-def getIndex(aList, text):
-    '''Returns the index of the requested text in the given list'''
-    for i,x in enumerate(aList):
-        if x == text:
-            return i
-
-def plot(data, fileName, title, subtitle, xaxisLabel, yaxisLabel, ystart, yend, ytics, linePreface):
-
-    # Replace '_' with ' '
-    g = Gnuplot.Gnuplot()
-    multiLineTitle = title.replace("_", " ") + '\\n '+ subtitle.replace("_", " ")
-    g.title(multiLineTitle)
-    g("set terminal svg noenhanced background rgb 'white' size 1000,800 fname 'Helvetica' fsize 16")
-    g("set key box outside center top horizontal font ',12' ")
-    g("set autoscale xy")
-    #g("set yrange [{0}:{1}]".format(unicode(ystart), unicode(yend)))
-    #g("set ytics {}".format(unicode(ytics)))
-    g("set grid")
-    g.xlabel(xaxisLabel.replace("_", " "))
-    g.ylabel(yaxisLabel.replace("_", " "))
-    g('set output "' + fileName + '"')
-    d = []
-    for key in sorted(data[statType[0]]):
-        result = Gnuplot.Data(  data['header'][key],data[statType[0]][key],\
-                                data[statType[1]][key],data[statType[2]][key],\
-                                with_="yerrorlines",title=linePreface+key   )
-        d.append(result)
-    g.plot(*d)
+# C.I. of the mean: 't' (Student's t-interval) or a bootstrap interval,
+# 'percentile' or 'bca' (resampling settings are in statsEngine.py)
+ciMethod        = 't'
 
-def plot_stats(dirPath, fileName, xaxisLabel, keyLabel, filterLabel, filterValue, model, lpCount):
+# Raw files larger than this are aggregated chunk by chunk with bounded memory
+# (chunk and reservoir sizes are set in streamStats.py); 0 always streams
+streamThresholdMB = 512
 
-    # Read the stats csv
-    inFile = dirPath + 'stats/' + rawDataFileName + '/' + fileName + '.csv'
-    reader = csv.reader(open(inFile,'rb'))
-    header = reader.next()
+# Rows flagged by the errlog run logs (see runLog.py) to leave out of the
+# stats: any of 'failed', 'error', 'unbuilt' (runLog.defaultExclude lists
+# all three). [] keeps every row, as the stats had them before the run logs
+# were read; empty branches are filled from the logs either way.
+excludeRuns     = []
 
-    # Get Column Values for use below
-    xaxis  = getIndex(header, xaxisLabel)
-    kid    = getIndex(header, keyLabel)
+# Result trees whose sequential.dat files are pooled with the directory's own
+# as repetitions of the speedup baseline (see baselineStore.py), e.g.
+# ['completed_logs', 'logs_again']; [] uses the directory's own only
+baselineRoots   = []
 
-    reader = sorted(reader, key=lambda x: int(x[xaxis]), reverse=False)
-    reader = sorted(reader, key=lambda x: x[kid], reverse=False)
+# Write every figure of a directory as a page of one PDF instead of one file each
+multiPagePdf    = False
+multiPageName   = 'all_figures.pdf'
 
-    for param in metricList:
-
-        metric = param['name']
-        ystart = param['ystart']
-        yend   = param['yend']
-        ytics  = param['ytics']
-
-        outData = {'header':{}}
-
-        # Populate the header
-        for kindex, kdata in itertools.groupby(reader, lambda x: x[kid]):
-            if kindex not in outData['header']:
-                outData['header'][kindex] = []
-            for xindex, data in itertools.groupby(kdata, lambda x: x[xaxis]):
-                outData['header'][kindex].append(xindex)
-
-        # Populate the statistical data
-        for stat in statType:
-            columnName  = metric + '_' + stat
-            columnIndex = getIndex(header, columnName)
-            if stat not in outData:
-                outData[stat] = {}
-            for xindex, data in itertools.groupby(reader, lambda x: x[xaxis]):
-                for kindex, kdata in itertools.groupby(data, lambda x: x[kid]):
-                    if kindex not in outData[stat]:
-                        outData[stat][kindex] = []
-                    value = [item[columnIndex] for item in kdata][0]
-                    outData[stat][kindex].append(value)
-
-        # Plot the statistical data
-        title = model.upper() + ' model with ' + str("{:,}".format(lpCount)) + ' LPs'
-        subtitle = filterLabel + ' = ' + str(filterValue).upper() + ' , key = ' + keyLabel
-        outDir = dirPath + 'plots/' + rawDataFileName + '/'
-        outFile = outDir + fileName + "_" + metric + '.svg'
-        yaxisLabel = metric + '_(C.I._=_95%)'
-        plot(outData, outFile, title, subtitle, xaxisLabel, yaxisLabel, ystart, yend, ytics, '')
-
-        # Convert svg to pdf and delete svg
-        outPDF = outDir + fileName + "_" + metric + '.pdf'
-        subprocess.call(['inkscape', outFile, '--export-pdf', outPDF])
-        subprocess.call(['rm', outFile])
-
-def calc_and_plot(dirPath):
-
-    # Load the sequential simulation time
-    # seqFile = dirPath + 'sequential.dat'
-    # if not os.path.exists(seqFile):
-    #     print('Sequential data not available')
-    #     sys.exit()
-    # seqFp = open(seqFile, 'r')
-    # seqCount, _, seqTime = seqFp.readline().split()
-    # seqFp.close()
-
-    # Load data from csv file
-    inFile = dirPath + rawDataFileName + '.csv'
-    if not os.path.exists(inFile):
-        print(rawDataFileName.upper() + ' raw data not available')
-        sys.exit()
-
-    data = pd.read_csv(inFile, sep=',')
-
-    data['Event_Commitment_Ratio'] = \
-            data['Events_Processed'] / data['Events_Committed']
-    data['Total_Rollbacks'] = \
-            data['Primary_Rollbacks'] + data['Secondary_Rollbacks']
-    data['Event_Processing_Rate_(per_sec)'] = \
-            data['Events_Processed'] / data['Simulation_Runtime_(secs.)']
-    data['Speedup_w.r.t._Sequential_Simulation'] = \
-            float(seqTime) / data['Simulation_Runtime_(secs.)']
-
-    # Create the plots directory (if needed)
-    outDir = dirPath + 'plots/'
-    if not os.path.exists(outDir):
-        os.makedirs(outDir)
-
-    outName = outDir + rawDataFileName + '/'
-    subprocess.call(['rm', '-rf', outName])
-    subprocess.call(['mkdir', outName])
-
-    # Create the stats directory (if needed)
-    outDir = dirPath + 'stats/'
-    if not os.path.exists(outDir):
-        os.makedirs(outDir)
-
-    outName = outDir + rawDataFileName + '/'
-    subprocess.call(['rm', '-rf', outName])
-    subprocess.call(['mkdir', outName])
-
-    for searchAttrs in searchAttrsList:
-        groupbyList = searchAttrs['groupby']
-        filterName  = searchAttrs['filter']
-        model       = searchAttrs['model']
-        lpcount     = searchAttrs['lpcount']
-        output      = searchAttrs['output']
-
-        groupbyList.append(filterName)
-
-        # Read unique values for the filter
-        filterValues = data[filterName].unique().tolist()
-
-        # Read the model name and LP count
-        modelName = data[model].unique().tolist()
-        lpCount   = data[lpcount].unique().tolist()
+###### Don't edit below here ######
 
-        for filterValue in filterValues:
-            # Filter data for each filterValue
-            filteredData = data[data[filterName] == filterValue]
-            groupedData = filteredData.groupby(groupbyList)
-            columnNames = list(groupbyList)
+# The steps are shared with temp.py (see statsPipeline.py); this
+# module is the pipeline they read the settings from
+settings        = sys.modules[__name__]
 
-            # Generate stats
-            result = pd.DataFrame()
-            for param in metricList:
-                metric = param['name']
-                columnNames += [metric + '_' + x for x in statType]
-                stats = groupedData.apply(lambda x : statistics(x[metric].tolist()))
-                result = pd.concat([result, stats], axis=1)
 
-            # Write to the csv
-            fileName = output + str(filterValue)
-            outFile = outName + fileName + '.csv'
-            statFile = open(outFile,'w')
-            for colName in columnNames:
-                statFile.write(colName + ',')
-            statFile.write("\n")
-            statFile.close()
-            result.to_csv(outFile, mode='a', header=False, sep=',')
+def plot_stats(dirPath, fileName, xaxisLabel, keyLabel, filterLabel, filterValue, model, lpCount, params=None, pages=None, stats=None):
+    statsPipeline.plot_stats(settings, dirPath, fileName, xaxisLabel, keyLabel, filterLabel, filterValue,
+                             model, lpCount, params, pages, stats)
 
-            # Remove " from the newly created csv file
-            # Note: It is needed since pandas package has an unresolved bug for
-            # quoting arg which retains the double quotes for column attributes.
-            sed_inplace(outFile, r'"', '')
+def raw_columns():
+    '''Raw csv columns needed by the groupings, filters and metrics'''
+    return statsPipeline.raw_columns(settings)
 
-            # Plot the statistics
-            plot_stats( dirPath, fileName, groupbyList[0], groupbyList[1],
-                            filterName, filterValue, modelName[0], lpCount[0] )
+def add_derived_metrics(data, workloads):
+    # Derived metrics of metricList, on the whole frame or on a streamed chunk
+    return statsPipeline.add_derived_metrics(settings, data, workloads)
 
+def calc_and_plot(dirPath, plots=True, read=None):
+    # plots=False only brings the stats up to date (e.g. for campaignReport.py);
+    # read(path, columns) replaces read_raw (e.g. plotAll.py)
+    return statsPipeline.calc_and_plot(settings, dirPath, plots, read)
 
 def main():
+    if len(sys.argv) != 2 or sys.argv[1] in ('-h', '--help'):
+        print('Usage: python plotScheduleQ.py <path_to_source>')
+        sys.exit(0 if sys.argv[1:] in (['-h'], ['--help']) else 1)
     dirPath = sys.argv[1]
     if not os.path.exists(dirPath):
         print('Invalid path to source')
         sys.exit()
 
-    calc_and_plot(dirPath)
+    with stage('directory', dir=dirPath):
+        calc_and_plot(dirPath)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+# Typed, column-pruned loader for the raw scheduleq.csv files
+#
+# The columns and their order come from the variables file; columnTypes
+# declares how each one is stored. read_raw() checks the header against the
+# schema before parsing anything (unknown or missing columns raise
+# SchemaError), reads only the requested columns, parses labels straight
+# into categoricals and narrows integer counters once their range is known
+# (a value that does not fit keeps int64 rather than wrapping around).
+#
+# Two known variants are accepted: the optional GVT_Period column, and rows
+# whose Model_Command was written unquoted and so spans two fields.
+
+import csv
+import os
+
+###### Settings go here ######
+
+variablesFile   = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'variables')
+
+# Storage type per column; integer columns are parsed as int64 and narrowed
+columnTypes     =   {   'branch'                        : 'category',
+                        'Model'                         : 'category',
+                        'Model_Command'                 : 'category',
+                        'Max_Simulation_Time'           : 'int32',
+                        'Worker_Thread_Count'           : 'int16',
+                        'Schedule_Queue_Type'           : 'category',
+                        'Schedule_Queue_Count'          : 'int16',
+                        'is_LP_Migration_ON'            : 'float32',
+                        'GVT_Method'                    : 'category',
+                        'GVT_Period'                    : 'int32',
+                        'State_Save_Period'             : 'int32',
+                        'Simulation_Runtime_(secs.)'    : 'float64',
+                        'Number_of_Objects'             : 'int32',
+                        'Local_Positive_Events_Sent'    : 'uint32',
+                        'Remote_Positive_Events_Sent'   : 'uint32',
+                        'Local_Negative_Events_Sent'    : 'uint32',
+                        'Remote_Negative_Events_Sent'   : 'uint32',
+                        'Primary_Rollbacks'             : 'uint32',
+                        'Secondary_Rollbacks'           : 'uint32',
+                        'Coast_Forwarded_Events'        : 'uint32',
+                        'Cancelled_Events'              : 'uint32',
+                        'Events_Processed'              : 'uint32',
+                        'Events_Committed'              : 'uint32',
+                        'Events_for_Starved_Objects'    : 'uint32',
+                        'Sched_Event_Swaps_Success'     : 'uint32',
+                        'Sched_Event_Swaps_Failed'      : 'uint32',
+                        'Average_Memory_Usage_(MB)'     : 'int32'
+                    }
+
+# Columns that only some campaigns write
+optionalColumns = ['GVT_Period']
+
+# Multi-threaded pyarrow parser when installed, else pandas' C parser
+parserEngine    = 'pyarrow'
+
+###### Don't edit below here ######
+
+splitColumn     = 'Model_Command'
+splitTail       = 'Model_Command_tail'
+
+
+class SchemaError(RuntimeError):
+    '''Raised when a raw csv does not match the declared schema'''
+
+
+def read_variables(path=variablesFile):
+    '''Raw csv columns, in order, as listed in the variables file'''
+    with open(path) as fp:
+        return [c.strip() for c in fp.read().replace('\n', '').split(',') if c.strip()]
+
+def check_header(path):
+    '''Returns (header, split): the csv header after validating it against
+    the schema, and whether the data rows carry an unquoted Model_Command'''
+    with open(path, newline='') as fp:
+        reader = csv.reader(fp)
+        header = next(reader, [])
+        firstRow = next(reader, None)
+
+    expected = read_variables()
+    missing = [c for c in expected if c not in header]
+    unknown = [c for c in header if c not in expected and c not in optionalColumns]
+    if missing or unknown:
+        raise SchemaError(f'{path}: schema drift, missing columns {missing}, unknown columns {unknown}')
+    if [c for c in header if c in expected] != expected:
+        raise SchemaError(f'{path}: schema drift, columns out of order')
+
+    split = firstRow is not None and len(firstRow) == len(header) + 1
+    if firstRow is not None and not split and len(firstRow) != len(header):
+        raise SchemaError(f'{path}: {len(firstRow)} fields in the first row, {len(header)} in the header')
+    return header, split
+
+def read_args(path, columns=None):
+    '''pd.read_csv keyword arguments reading the given columns (all when
+    None) of the raw csv at path with the declared parse types'''
+    header, split = check_header(path)
+    if columns is None:
+        columns = list(header)
+    unknown = [c for c in columns if c not in header]
+    if unknown:
+        raise SchemaError(f'{path}: requested columns {unknown} are not in the file')
+
+    wanted = [c for c in header if c in columns]
+    if split and splitColumn in wanted:
+        wanted.insert(wanted.index(splitColumn) + 1, splitTail)
+    dtype = {c: 'int64' if columnTypes[c].startswith(('int', 'uint')) else columnTypes[c]
+             for c in wanted if c in columnTypes}
+    if splitTail in wanted:
+        dtype[splitColumn] = dtype[splitTail] = 'str'
+
+    args = {'usecols': wanted, 'dtype': dtype}
+    if split:
+        names = list(header)
+        names.insert(names.index(splitColumn) + 1, splitTail)
+        args.update(names=names, header=None, skiprows=1)
+    return args
+
+def narrow(frame, path=''):
+    '''Rejoins a split Model_Command and narrows the integer columns'''
+    import numpy as np
+
+    if splitTail in frame.columns:
+        command = frame[splitColumn].str.cat(frame.pop(splitTail), sep=',')
+        frame[splitColumn] = command.astype('category')
+
+    for column in frame.columns:
+        target = columnTypes.get(column, '')
+        if not target.startswith(('int', 'uint')) or frame[column].dtype == target:
+            continue
+        values = frame[column]
+        if values.dtype.kind not in 'iu':
+            raise SchemaError(f'{path}: column {column} is not integer ({values.dtype})')
+        info = np.iinfo(target)
+        if values.empty or (values.min() >= info.min and values.max() <= info.max):
+            frame[column] = values.astype(target)
+    return frame
+
+def read_raw(path, columns=None, cached=True):
+    '''Typed frame of the given columns of the raw csv at path'''
+    import pandas as pd
+    from frameCache import read_csv_cached
+
+    args = read_args(path, columns)
+    if parserEngine == 'pyarrow' and 'names' not in args:
+        # The pyarrow engine cannot rename a split header
+        try:
+            import pyarrow  # noqa: F401
+            args['engine'] = 'pyarrow'
+        except ImportError:
+            pass
+    reader = read_csv_cached if cached else pd.read_csv
+    try:
+        frame = reader(path, **args)
+    except (ValueError, OverflowError) as err:
+        raise SchemaError(f'{path}: {err}{malformed_rows(path)}') from err
+    return narrow(frame, path)
+
+def malformed_rows(path, limit=5):
+    '''Describes the data lines whose field count differs from the first
+    data row's, for error messages'''
+    with open(path, newline='') as fp:
+        rows = enumerate(csv.reader(fp), 1)
+        next(rows, None)
+        first = next(rows, None)
+        if first is None:
+            return ''
+        bad = [(line, len(row)) for line, row in rows if len(row) != len(first[1])]
+    if not bad:
+        return ''
+    shown = ', '.join(f'line {line} ({n} fields)' for line, n in bad[:limit])
+    more = f' and {len(bad) - limit} more' if len(bad) > limit else ''
+    return f'; {len(bad)} malformed rows: {shown}{more} (first row has {len(first[1])})'
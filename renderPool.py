@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+# Process pool for rendering figures in parallel
+#
+#     render_all([(plot_stats, (dirPath, fileName, ...), {'stats': table}), ...])
+#
+# A job is a module-level function with its arguments: it draws one or more
+# figures from data that is already aggregated and saves them under file
+# names given by its arguments, so jobs are independent of each other and of
+# the order they run in. Results come back in job order.
+#
+# The pool is started on first use and kept for the life of the process.
+# Workers are forked (so the driver's imports and settings are inherited),
+# switch to the headless Agg backend and warm matplotlib's font and text
+# caches once with a throwaway figure. Each job runs with the rcParams (style)
+# of the caller at the time it was submitted and restores them afterwards, so
+# the figures do not depend on which worker drew them or what it drew before.
+# Fewer than minJobs jobs, or a single worker, render in the calling process.
+
+import atexit
+import os
+
+###### Settings go here ######
+
+# Worker processes; 0 uses every core available to the process
+renderWorkers   = 0
+
+# Smaller batches are not worth a round trip through the pool
+minJobs         = 2
+
+###### Don't edit below here ######
+
+_executor       = None
+
+
+def worker_count():
+    if renderWorkers:
+        return renderWorkers
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def warm_worker():
+    '''Pool initializer: headless backend, then one throwaway figure through
+    the pdf and png writers so fonts and glyph caches are loaded once'''
+    import io
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(2, 2))
+    ax = fig.add_subplot(1, 1, 1)
+    ax.errorbar([0, 1], [0, 1], yerr=[0.1, 0.1], fmt='-o', label='warm-up')
+    ax.legend()
+    ax.set_title('warm-up')
+    for fmt in ('pdf', 'png'):
+        fig.savefig(io.BytesIO(), format=fmt, bbox_inches='tight')
+
+def get_pool():
+    global _executor
+    if _executor is None:
+        import multiprocessing as mp
+        from concurrent.futures import ProcessPoolExecutor
+        context = mp.get_context('fork') if 'fork' in mp.get_all_start_methods() \
+                    else mp.get_context()
+        _executor = ProcessPoolExecutor(max_workers=worker_count(), mp_context=context,
+                                        initializer=warm_worker)
+    return _executor
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(cancel_futures=True)
+        _executor = None
+
+atexit.register(shutdown)
+
+def run_job(func, args, kwargs, rc=None):
+    # Every job starts from the caller's rcParams and leaves no style behind
+    import matplotlib
+    with matplotlib.rc_context(rc):
+        return func(*args, **kwargs)
+
+def render_all(jobs):
+    '''Runs jobs, a list of (func, args[, kwargs]), across the pool; returns
+    their results in job order. The first failing job's exception is raised
+    once every job has finished.'''
+    jobs = [(job[0], tuple(job[1]), job[2] if len(job) > 2 else {}) for job in jobs]
+    if len(jobs) < minJobs or worker_count() < 2:
+        return [run_job(*job) for job in jobs]
+
+    # Workers were forked with the rcParams of that moment; send the current ones
+    import matplotlib
+    rc = {k: v for k, v in matplotlib.rcParams.items() if not k.startswith('backend')}
+
+    from concurrent.futures.process import BrokenProcessPool
+    try:
+        futures = [get_pool().submit(run_job, *job, rc) for job in jobs]
+        errors = [future.exception() for future in futures if future.exception() is not None]
+    except BrokenProcessPool as err:
+        errors = [err]
+    if errors:
+        if isinstance(errors[0], BrokenProcessPool):
+            shutdown()      # a worker died; the next call starts a new pool
+        raise errors[0]
+    return [future.result() for future in futures]
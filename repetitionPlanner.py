@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+
+# Plans how many more repetitions each configuration of a sweep needs
+#
+#     python repetitionPlanner.py completed_logs/hashing_20240702081541 --budget 36000
+#
+# The rows of every run set below the given directories are loaded as temp.py
+# loads them (run log exclusions and derived metrics included) and grouped by
+# run configuration: branch, thread count, queue type and queue count, plus
+# the fields of the harness command line. compute_stats gives each group's
+# mean and t C.I., from which the sample standard deviation is recovered. For every metric the smallest
+# total repetition count whose expected C.I. width, relative to the mean, is
+# within its target is found in one vectorized pass over the candidate counts;
+# a configuration needs the most any of its metrics needs.
+#
+# The plan is written as runScheduleQ lines in the format the campaign
+# scripts log them (see runLog.py):
+#     runScheduleQ <runs> <timeout> <model> <command> <max sim time> <threads>
+#         <queue type> <queue count> <gvt method> <gvt period> <state save period>
+# grouped by branch, noisiest configurations first (largest C.I. width over
+# its target). With a budget, configurations are taken in that order while
+# their estimated time (extra runs times their mean runtime) fits.
+#
+# The csv records the command with its whitespace stripped, so the command is
+# recovered from the run lines of the errlogs of every run set scanned
+# (matched without whitespace). A configuration whose command no log holds is
+# written commented out, to be completed by hand.
+
+import argparse
+import os
+import shlex
+import sys
+
+###### Settings go here ######
+
+# Full C.I. width relative to the mean, per metric (metrics not listed use
+# defaultTarget)
+targets         =   {   'Simulation_Runtime_(secs.)'            : 0.05,
+                        'Event_Processing_Rate_(per_sec)'       : 0.05,
+                        'Speedup_w.r.t._Sequential_Simulation'  : 0.05,
+                        'Event_Commitment_Ratio'                : 0.02
+                    }
+defaultTarget   = 0.05
+
+minRuns         = 3         # fewer runs give no usable spread estimate
+maxRuns         = 100       # total repetitions never planned beyond this
+
+runScript       = 'runScheduleQ'
+runTimeout      = 150       # seconds, second field of the harness line
+defaultGvtPeriod = 1000     # for campaigns without a GVT_Period column
+
+planFileName    = 'repetition_plan.txt'
+
+###### Don't edit below here ######
+
+configColumns   = ['branch', 'Worker_Thread_Count', 'Schedule_Queue_Type', 'Schedule_Queue_Count']
+commandColumns  = ['Model', 'Model_Command', 'Max_Simulation_Time', 'GVT_Method',
+                   'GVT_Period', 'State_Save_Period']
+
+
+def load_rows(dirPath, pipeline):
+    '''Rows of one run set with the metrics of pipeline, as it computes them'''
+    from baselineStore import load_baselines, workload_stats
+    from rawSchema import check_header, columnTypes, read_raw
+    from runLog import apply_run_log, load_run_log
+
+    inFile = os.path.join(dirPath, pipeline.rawDataFileName + '.csv')
+    header, _ = check_header(inFile)
+    wanted = set(pipeline.raw_columns()) | set(configColumns) | set(commandColumns)
+    columns = [c for c in columnTypes if c in wanted and c in header]
+
+    data = apply_run_log(read_raw(inFile, columns), load_run_log(dirPath), pipeline.excludeRuns)
+    workloads = workload_stats(load_baselines(dirPath, pipeline.baselineRoots))
+    data = pipeline.add_derived_metrics(data, workloads)
+    if 'GVT_Period' not in data.columns:
+        data['GVT_Period'] = defaultGvtPeriod
+    return data
+
+def required_runs(n, mean, lower, upper, target, confidence=0.95):
+    '''Smallest total repetition count per group whose expected relative C.I.
+    width is within target, from its current count, mean and C.I.; NaN when
+    the spread cannot be estimated. Counts that would exceed maxRuns are
+    returned as maxRuns + 1.'''
+    import numpy as np
+    import scipy.stats as sps
+
+    n = np.asarray(n, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Invert the t-interval half width h = t(n) s / sqrt(n)
+        tNow = sps.t.ppf((1 + confidence) / 2., n - 1)
+        sd = (upper - lower) / 2. * np.sqrt(n) / tNow
+        relative = sd / np.abs(mean)
+
+        candidates = np.arange(2, maxRuns + 1)
+        tCand = sps.t.ppf((1 + confidence) / 2., candidates - 1)
+        widths = 2 * tCand[None, :] * relative[:, None] / np.sqrt(candidates)[None, :]
+    fits = (widths <= target) & (candidates[None, :] >= np.maximum(n, minRuns)[:, None])
+
+    needed = np.where(fits.any(axis=1), candidates[fits.argmax(axis=1)], maxRuns + 1).astype(float)
+    needed[(n < 2) | ~np.isfinite(relative)] = np.nan
+    needed[(n >= 2) & (relative == 0)] = np.maximum(n, minRuns)[(n >= 2) & (relative == 0)]
+    return needed
+
+def plan_runs(data, metrics):
+    '''Frame of every configuration with its runs, current relative C.I.
+    width and needed total per metric, and the extra runs it needs'''
+    import numpy as np
+    from statsEngine import compute_stats
+
+    keys = configColumns + commandColumns
+    frame = data.copy()
+    for column in keys:
+        # Group keys must not be missing (e.g. an empty queue type)
+        if frame[column].dtype.kind not in 'iuf':
+            frame[column] = frame[column].astype(str).replace('nan', '')
+    metrics = [m for m in metrics if m in frame.columns]
+    stats = compute_stats(frame, keys, metrics)
+    plan = stats[[]].copy()
+    plan['Runs'] = frame.groupby(keys, sort=True).size()
+    plan['Mean_Runtime'] = frame.groupby(keys, sort=True)['Simulation_Runtime_(secs.)'].mean()
+
+    n = plan['Runs'].to_numpy()
+    needed = np.full(len(plan), float(minRuns))
+    worst = np.zeros(len(plan))
+    for metric in metrics:
+        mean = stats[metric + '_Mean'].to_numpy()
+        lower, upper = stats[metric + '_CI_Lower'].to_numpy(), stats[metric + '_CI_Upper'].to_numpy()
+        target = targets.get(metric, defaultTarget)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            width = (upper - lower) / np.abs(mean)
+        plan[metric + '_Width'] = np.where(n >= 2, width, np.nan)
+        plan[metric + '_Needed'] = required_runs(n, mean, lower, upper, target)
+        needed = np.fmax(needed, plan[metric + '_Needed'].to_numpy())
+        worst = np.fmax(worst, plan[metric + '_Width'].to_numpy() / target)
+
+    plan['Capped'] = needed > maxRuns
+    plan['Extra_Runs'] = (np.minimum(needed, maxRuns) - n).clip(min=0).astype(int)
+    plan['Noise'] = worst       # widest relative C.I. over its target
+    plan['Est_Seconds'] = plan['Extra_Runs'] * plan['Mean_Runtime']
+    return plan.reset_index()
+
+def prioritize(plan, budget=None):
+    '''Configurations needing runs, noisiest first, cut to the budget
+    (estimated seconds) when given'''
+    todo = plan[plan['Extra_Runs'] > 0].sort_values(['Noise', 'Est_Seconds'], ascending=[False, True],
+                                                    kind='mergesort')
+    if budget is not None:
+        # Greedy in priority order: skip what no longer fits, keep filling
+        kept, spent = [], 0.
+        for i, seconds in zip(todo.index, todo['Est_Seconds']):
+            if spent + seconds <= budget:
+                kept.append(i)
+                spent += seconds
+        todo = todo.loc[kept]
+    return todo
+
+def compact(command):
+    return ''.join(str(command).split())
+
+def logged_commands(dirPaths):
+    '''Model commands of the run lines logged in the errlogs of dirPaths,
+    keyed by the command without whitespace (as the csv records it)'''
+    from runLog import find_logs, parse_errlog
+
+    commands = {}
+    for dirPath in dirPaths:
+        for path in find_logs(dirPath):
+            for record in parse_errlog(path):
+                if record['kind'] == 'run':
+                    commands.setdefault(compact(record['command']), record['command'])
+    return commands
+
+def run_line(row, command):
+    '''Harness command line of one planned configuration'''
+    fields = [runScript, row['Extra_Runs'], runTimeout, row['Model'], command,
+              row['Max_Simulation_Time'], row['Worker_Thread_Count'], row['Schedule_Queue_Type'],
+              row['Schedule_Queue_Count'], row['GVT_Method'], row['GVT_Period'], row['State_Save_Period']]
+    return ' '.join(shlex.quote(str(f)) for f in fields)
+
+def write_plan(todo, outFile, source, commands):
+    '''Writes the prioritized run lines, grouped by branch in priority order;
+    returns how many are commented out for want of their command'''
+    missing = 0
+    hours = todo['Est_Seconds'].sum() / 3600.
+    lines = [f"# {source}: {len(todo)} configurations, {int(todo['Extra_Runs'].sum())} more runs, "
+             f"~{hours:.1f} h"]
+    for branch in dict.fromkeys(todo['branch']):
+        lines.append(f"# branch {branch or '-'}")
+        for _, row in todo[todo['branch'] == branch].iterrows():
+            capped = '  # capped at maxRuns' if row['Capped'] else ''
+            command = commands.get(compact(row['Model_Command']))
+            if command is None:
+                # Not runnable as the csv has it: leave it to be completed
+                missing += 1
+                lines.append('# command not in the run logs: ' +
+                             run_line(row, row['Model_Command']) + capped)
+            else:
+                lines.append(run_line(row, command) + capped)
+    tmpPath = f'{outFile}.{os.getpid()}.tmp'
+    with open(tmpPath, 'w') as fp:
+        fp.write('\n'.join(lines) + '\n')
+    os.replace(tmpPath, outFile)
+    return missing
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Plan the repetitions each configuration needs to reach a target C.I. width")
+    parser.add_argument("paths", nargs='+', help="Run set directories or result trees (e.g., 'completed_logs')")
+    parser.add_argument("--budget", type=float, help="Estimated cluster seconds to plan at most, per run set")
+    parser.add_argument("--output", help=f"Plan file (default: {planFileName} in each run set)")
+    parser.add_argument("--csv", help="Write every configuration's estimates to this csv file")
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    for path in args.paths:
+        if not os.path.isdir(path):
+            print(f'Invalid path to source: {path}')
+            sys.exit(1)
+
+    import pandas as pd
+    import temp as pipeline
+    from campaignCatalog import find_run_sets
+    from rawSchema import SchemaError
+
+    metrics = [param['name'] for param in pipeline.metricList]
+    runSets = [dirPath for path in args.paths for dirPath in find_run_sets(path)]
+    commands = logged_commands(runSets)
+    plans = []
+    for dirPath in runSets:
+        if not os.path.exists(os.path.join(dirPath, pipeline.rawDataFileName + '.csv')):
+            continue
+        try:
+            data = load_rows(dirPath, pipeline)
+        except SchemaError as err:
+            print(f"Skipping {dirPath}: {err}", file=sys.stderr)
+            continue
+        if data.empty:
+            continue
+        plan = plan_runs(data, metrics)
+        todo = prioritize(plan, args.budget)
+        outFile = args.output or os.path.join(dirPath, planFileName)
+        if args.output and plans:
+            outFile = f"{os.path.splitext(args.output)[0]}_{len(plans)}{os.path.splitext(args.output)[1]}"
+        missing = write_plan(todo, outFile, dirPath, commands)
+        converged = int((plan['Extra_Runs'] == 0).sum())
+        print(f"{outFile}: {len(todo)} of {len(plan)} configurations need "
+              f"{int(todo['Extra_Runs'].sum())} more runs (~{todo['Est_Seconds'].sum() / 3600.:.1f} h), "
+              f"{converged} converged")
+        if missing:
+            print(f"{outFile}: {missing} lines commented out, their command is not in the run logs")
+        plans.append(plan.assign(path=dirPath))
+    if args.csv and plans:
+        pd.concat(plans, ignore_index=True).to_csv(args.csv, index=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+# Runs the per-model plots (customPlot.py) and the per-campaign unified plots
+# (customOverallplot.py) over a results root in parallel.
+#
+# Layout: <root>/<campaign>/<model>/ as in completed_logs/. The unified plot
+# of a campaign starts once all of its model directories have finished; when
+# one of them failed, timed out or was skipped, it is skipped as well.
+# Tasks run in forked worker processes, so the plotting modules are imported
+# once by the driver instead of once per directory. The entry points import
+# their heavy dependencies lazily, so the driver warms them up before the
+# first fork.
+
+import argparse
+import multiprocessing as mp
+import multiprocessing.connection
+import os
+import sys
+import time
+import traceback
+
+from campaignCatalog import build_catalog
+from stageTrace import stage
+import customOverallplot
+import customPlot
+
+
+class Task:
+    def __init__(self, name, func, args, deps=()):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.deps = list(deps)
+        self.process = None
+        self.started = None
+        self.status = 'pending'
+        self.elapsed = 0.0
+
+def warm_up():
+    # Import the heavy modules once in the driver; forked workers inherit them
+    import pandas, matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot, seaborn  # noqa: F401
+    import frameCache, statsEngine  # noqa: F401
+    customOverallplot.set_style()
+    # The tasks already fill the cores: each one renders its figures itself
+    import renderPool
+    renderPool.renderWorkers = 1
+
+def run_task(func, args):
+    # Child process entry point: any exception becomes a non-zero exit code
+    try:
+        with stage('task', task=func.__name__, dir=args[0]):
+            func(*args)
+    except BaseException:
+        traceback.print_exc()
+        sys.exit(1)
+
+def build_tasks(root):
+    '''Mirrors runall.sh: customPlot per $root/*/*/, unified plot per $root/*,
+    using the campaign catalog instead of walking the tree'''
+    root = os.path.normpath(os.path.abspath(root))
+    catalog = build_catalog([root])
+
+    campaigns = {}
+    for runSet in catalog.query(under=root):
+        campaignDir = os.path.dirname(runSet['path'])
+        if os.path.dirname(campaignDir) == root and runSet['scheduleq']:
+            campaigns.setdefault(campaignDir, []).append(runSet['path'])
+
+    tasks = []
+    for campaignDir in sorted(campaigns):
+        modelTasks = []
+        for modelDir in sorted(campaigns[campaignDir]):
+            task = Task(os.path.relpath(modelDir), customPlot.generate_plots, (modelDir,))
+            modelTasks.append(task)
+        tasks += modelTasks
+        pattern = os.path.join(campaignDir, '*')
+        tasks.append(Task(os.path.relpath(pattern), customOverallplot.generate_unified_plots,
+                          (pattern,), deps=modelTasks))
+    return tasks
+
+def run_tasks(tasks, jobs, timeout):
+    '''Runs tasks with at most jobs in flight, honouring dependencies.
+    Tasks exceeding timeout seconds are terminated and reported as failed;
+    tasks depending on a task that did not succeed are skipped.'''
+    context = mp.get_context('fork') if 'fork' in mp.get_all_start_methods() \
+                else mp.get_context()
+    pending = list(tasks)
+    running = []
+
+    while pending or running:
+        # Skip the tasks whose dependencies did not succeed
+        for task in list(pending):
+            if any(dep.status in ('failed', 'timeout', 'skipped') for dep in task.deps):
+                pending.remove(task)
+                task.status = 'skipped'
+                print(f"[skipped] {task.name}")
+
+        # Start every ready task while there is a free slot
+        for task in list(pending):
+            if len(running) >= jobs:
+                break
+            if any(dep.status in ('pending', 'running') for dep in task.deps):
+                continue
+            pending.remove(task)
+            task.process = context.Process(target=run_task, args=(task.func, task.args))
+            task.process.start()
+            task.started = time.monotonic()
+            task.status = 'running'
+            running.append(task)
+
+        if not running:
+            continue
+
+        # Wait until a task exits or the earliest deadline passes
+        wait = None
+        if timeout:
+            now = time.monotonic()
+            wait = max(0.0, min(t.started + timeout for t in running) - now)
+        mp.connection.wait([t.process.sentinel for t in running], timeout=wait)
+
+        now = time.monotonic()
+        for task in list(running):
+            if task.process.exitcode is None:
+                if timeout and now - task.started > timeout:
+                    task.process.terminate()
+                    task.process.join()
+                    task.status = 'timeout'
+                else:
+                    continue
+            else:
+                task.process.join()
+                task.status = 'ok' if task.process.exitcode == 0 else 'failed'
+            task.elapsed = now - task.started
+            running.remove(task)
+            print(f"[{task.status}] {task.name} ({task.elapsed:.1f}s)")
+
+    return [t for t in tasks if t.status != 'ok']
+
+def print_summary(tasks, failures):
+    print("------------------------")
+    print(f"{len(tasks) - len(failures)} of {len(tasks)} tasks succeeded")
+    for task in failures:
+        print(f"  {task.status:8s} {task.name}")
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Generate per-model and unified plots for every campaign in parallel")
+    parser.add_argument("root", help="Results root containing <campaign>/<model>/ directories (e.g., 'completed_logs')")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="Maximum number of concurrent tasks (default: number of cores)")
+    parser.add_argument("--timeout", type=float, default=600,
+                        help="Per-task timeout in seconds, 0 disables it (default: 600)")
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    if not os.path.isdir(args.root):
+        print('Invalid path to source')
+        sys.exit(1)
+
+    tasks = build_tasks(args.root)
+    if tasks:
+        warm_up()
+    failures = run_tasks(tasks, max(1, args.jobs), args.timeout)
+    print_summary(tasks, failures)
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+
+# Parses the errlog_*.config run logs and joins them to the scheduleq.csv rows
+#
+# The campaign scripts append one line per build to the errlog
+#     build /home/shindegy <branch> [<mpi include dir>] "<configure flags>"
+# and one line per run that did not produce a result
+#     runScheduleQ <n> <limit> <model> "<command>" <max sim time> <threads> [""] <queue count> <gvt method> <gvt period> <state save period>
+# (runUnifiedQ likewise). Any other line, and any line mentioning an error,
+# is kept as an error marker of the build it follows.
+#
+# The logs are read line by line in the order of the timestamp in their
+# names. Rows of scheduleq.csv come in blocks of one branch, in build order;
+# the csv only holds the latest sessions, so blocks are matched to the builds
+# from the end (a block out of that order goes to the latest build of its
+# branch). Each row range is then flagged:
+#     failed      its build also has failed runs of the same configuration
+#     error       its build logged an error marker
+#     unbuilt     no logged build matches its branch
+#     unlabelled  the branch column is empty (it is taken from the build)
+# The result is stored as a small JSON index (.runlog.json) in the run set
+# directory and refreshed when the size or mtime of the csv or a log changes.
+
+import csv
+import datetime
+import glob
+import json
+import os
+import re
+import shlex
+
+###### Settings go here ######
+
+indexFileName   = '.runlog.json'
+
+rawDataFileName = 'scheduleq'
+
+# Flags of rows that did not run as configured (see above): counted by the
+# catalog, and dropped from the stats when a script's excludeRuns lists them
+defaultExclude  = ['failed', 'error', 'unbuilt']
+
+# Lines matching this are error markers even when they parse as a record
+errorPattern    = re.compile(r'error|fail|abort|segmentation|core dumped|killed|timed? ?out|terminated',
+                             re.IGNORECASE)
+
+###### Don't edit below here ######
+
+indexVersion    = 1
+
+logPattern      = re.compile(r'^errlog_(?P<stamp>\d\d-\d\d-\d\d_\d\d:\d\d:\d\d)\.config$')
+
+runScripts      = ('runScheduleQ', 'runUnifiedQ')
+
+
+def log_time(path):
+    '''Timestamp in the name of an errlog, None when it has none'''
+    match = logPattern.match(os.path.basename(path))
+    if not match:
+        return None
+    return datetime.datetime.strptime(match.group('stamp'), '%m-%d-%y_%H:%M:%S')
+
+def find_logs(dirPath):
+    '''errlog_*.config files of dirPath, oldest first'''
+    logs = glob.glob(os.path.join(dirPath, 'errlog_*.config'))
+    return sorted(logs, key=lambda p: (log_time(p) is None, log_time(p) or datetime.datetime.min, p))
+
+def parse_line(line):
+    '''Record of one errlog line: a build, a run or an error marker'''
+    text = line.strip()
+    try:
+        # A lone backslash stands for an empty argument
+        fields = shlex.split(text.replace(' \\ ', ' "" '))
+    except ValueError:
+        fields = []
+
+    record = None
+    if len(fields) >= 3 and fields[0] == 'build':
+        record = {'kind': 'build', 'home': fields[1], 'branch': fields[2],
+                  'include': fields[3] if len(fields) > 4 else '',
+                  'flags': fields[-1] if len(fields) > 3 else ''}
+    elif len(fields) >= 10 and fields[0] in runScripts:
+        try:
+            record = {'kind': 'run', 'script': fields[0], 'model': fields[3],
+                      'command': fields[4].strip(), 'maxSimTime': int(fields[5]),
+                      'threads': int(fields[6]), 'queueCount': int(fields[-4]),
+                      'gvtMethod': fields[-3], 'gvtPeriod': int(fields[-2]),
+                      'stateSavePeriod': int(fields[-1])}
+        except ValueError:
+            record = None
+
+    if record is None or errorPattern.search(text):
+        return {'kind': 'error', 'text': text}
+    return record
+
+def parse_errlog(path):
+    '''Yields the records of an errlog, line by line'''
+    with open(path, errors='replace') as fp:
+        for number, line in enumerate(fp, 1):
+            if not line.strip():
+                continue
+            record = parse_line(line)
+            record['log'] = os.path.basename(path)
+            record['line'] = number
+            yield record
+
+def read_builds(logs):
+    '''Builds of the logs in order, each with the runs and error markers
+    logged after it'''
+    builds = []
+    orphans = []        # records before the first build
+    for path in logs:
+        for record in parse_errlog(path):
+            if record['kind'] == 'build':
+                record.update(failedRuns=[], errors=[])
+                builds.append(record)
+                continue
+            target = builds[-1] if builds else None
+            if target is None:
+                orphans.append(record)
+            elif record['kind'] == 'run':
+                target['failedRuns'].append(record)
+            else:
+                target['errors'].append(record['text'])
+    return builds, orphans
+
+def read_row_blocks(csvFile):
+    '''Consecutive rows of the same branch and configuration as
+    (first row, last row, branch, threads, queue count)'''
+    from rawSchema import check_header, splitColumn
+
+    header, split = check_header(csvFile)
+    shift = lambda i: i + 1 if split and i > header.index(splitColumn) else i
+    branchAt = header.index('branch')
+    threadsAt = shift(header.index('Worker_Thread_Count'))
+    queuesAt = shift(header.index('Schedule_Queue_Count'))
+
+    blocks = []
+    with open(csvFile, newline='') as fp:
+        reader = csv.reader(fp)
+        next(reader, None)
+        row = -1
+        for fields in reader:
+            if not fields:
+                continue
+            row += 1
+            config = tuple(fields[i] if i < len(fields) else ''
+                           for i in (branchAt, threadsAt, queuesAt))
+            if blocks and blocks[-1][1] == row - 1 and blocks[-1][2:] == config:
+                blocks[-1][1] = row
+            else:
+                blocks.append([row, row, *config])
+    return blocks
+
+def join_rows(builds, blocks):
+    '''Row ranges with the index of their build and their flags'''
+    # Branch runs of blocks, newest first, matched to builds newest first
+    runs = []
+    for block in blocks:
+        if runs and runs[-1]['branch'] == block[2]:
+            runs[-1]['blocks'].append(block)
+        else:
+            runs.append({'branch': block[2], 'blocks': [block]})
+
+    owner = {}
+    b = len(builds) - 1
+    for i in range(len(runs) - 1, -1, -1):
+        branch = runs[i]['branch']
+        j = b
+        while j >= 0 and branch and builds[j]['branch'] != branch:
+            j -= 1
+        if j >= 0:
+            owner[i] = j
+            b = j - 1
+        elif branch:
+            # Out of build order (e.g. a rerun appended later): the latest
+            # build of the branch, if it was built at all
+            owner.update({i: k for k, build in enumerate(builds) if build['branch'] == branch})
+
+    rows = []
+    for i, run in enumerate(runs):
+        build = owner.get(i)
+        for first, last, branch, threads, queues in run['blocks']:
+            flags = []
+            if build is None:
+                flags.append('unbuilt' if branch else 'unlabelled')
+            else:
+                if not branch:
+                    flags.append('unlabelled')
+                failed = {(str(r['threads']), str(r['queueCount'])) for r in builds[build]['failedRuns']}
+                if (threads, queues) in failed:
+                    flags.append('failed')
+                if builds[build]['errors']:
+                    flags.append('error')
+            name = branch or (builds[build]['branch'] if build is not None else '')
+            if rows and rows[-1]['last'] == first - 1 and \
+                    (rows[-1]['build'], rows[-1]['branch'], rows[-1]['flags']) == (build, name, flags):
+                rows[-1]['last'] = last
+            else:
+                rows.append({'first': first, 'last': last, 'build': build,
+                             'branch': name, 'flags': flags})
+    return rows
+
+def run_files(dirPath):
+    csvFile = os.path.join(dirPath, rawDataFileName + '.csv')
+    return (csvFile if os.path.exists(csvFile) else None), find_logs(dirPath)
+
+def signature(paths):
+    return [[os.path.basename(p), os.stat(p).st_size, os.stat(p).st_mtime_ns] for p in paths]
+
+def index_run_log(dirPath):
+    '''Run log index of a run set directory, built from scratch'''
+    csvFile, logs = run_files(dirPath)
+    builds, orphans = read_builds(logs)
+    # Without logged builds there is nothing to match the rows against
+    blocks = []
+    if csvFile and builds:
+        from rawSchema import SchemaError
+        try:
+            blocks = read_row_blocks(csvFile)
+        except SchemaError:
+            pass        # reported by the loader that reads the rows
+    rows = join_rows(builds, blocks)
+    return {'version': indexVersion,
+            'signature': signature(([csvFile] if csvFile else []) + logs),
+            'logs': [os.path.basename(p) for p in logs],
+            'builds': [{k: b[k] for k in ('log', 'line', 'branch', 'include', 'flags', 'errors')} |
+                       {'failedRuns': len(b['failedRuns']),
+                        'failedConfigs': sorted({(r['threads'], r['queueCount']) for r in b['failedRuns']})}
+                       for b in builds],
+            'orphans': [r.get('text', r['kind']) for r in orphans],
+            'rows': rows}
+
+def load_run_log(dirPath, save=True):
+    '''Run log index of dirPath, from .runlog.json when still current'''
+    csvFile, logs = run_files(dirPath)
+    sig = signature(([csvFile] if csvFile else []) + logs)
+    indexFile = os.path.join(dirPath, indexFileName)
+    if os.path.exists(indexFile):
+        try:
+            with open(indexFile) as fp:
+                index = json.load(fp)
+            if index.get('version') == indexVersion and index.get('signature') == sig:
+                return index
+        except (OSError, ValueError):
+            pass
+
+    index = index_run_log(dirPath)
+    if save and logs:
+        tmpPath = f'{indexFile}.{os.getpid()}.tmp'
+        try:
+            with open(tmpPath, 'w') as fp:
+                json.dump(index, fp, indent=1)
+            os.replace(tmpPath, indexFile)
+        except OSError:
+            pass        # read-only tree: the index is rebuilt next time
+    return index
+
+def flagged_rows(index, flags=defaultExclude):
+    '''Positions of the csv rows carrying any of flags'''
+    flags = set(flags)
+    rows = []
+    for r in index['rows']:
+        if flags.intersection(r['flags']):
+            rows.extend(range(r['first'], r['last'] + 1))
+    return rows
+
+def apply_run_log(frame, index, exclude=defaultExclude):
+    '''Drops the rows of frame (indexed by csv row position, e.g. a whole
+    read or a streamed chunk) flagged with any of exclude and fills empty
+    branch values from their build. Returns the new frame.'''
+    import pandas as pd
+
+    flagged = set(flagged_rows(index, exclude))
+    if flagged:
+        frame = frame[~frame.index.isin(list(flagged))]
+
+    if 'branch' in frame.columns:
+        fills = [(r['first'], r['last'], r['branch']) for r in index['rows']
+                 if 'unlabelled' in r['flags'] and r['branch']]
+        if fills:
+            frame = frame.copy()
+            branch = frame['branch']
+            if isinstance(branch.dtype, pd.CategoricalDtype):
+                new = sorted({b for _, _, b in fills} - set(branch.cat.categories))
+                branch = branch.cat.add_categories(new)
+            for first, last, name in fills:
+                rows = (frame.index >= first) & (frame.index <= last)
+                empty = (branch.isna() | (branch.astype(object) == '')).to_numpy()
+                branch = branch.mask(rows & empty, name)
+            frame['branch'] = branch
+    return frame
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Index the errlog run logs of run set directories")
+    parser.add_argument("dirs", nargs='+', help="Run set directories")
+    args = parser.parse_args()
+
+    for dirPath in args.dirs:
+        index = load_run_log(dirPath)
+        print(f"{dirPath}: {len(index['logs'])} logs, {len(index['builds'])} builds")
+        for i, build in enumerate(index['builds']):
+            rows = sum(r['last'] - r['first'] + 1 for r in index['rows'] if r['build'] == i)
+            errors = f", {len(build['errors'])} errors" if build['errors'] else ''
+            print(f"  {build['branch']:20s} {rows:6d} rows {build['failedRuns']:4d} failed runs{errors}")
+        for r in index['rows']:
+            if r['flags']:
+                print(f"  rows {r['first']}-{r['last']} ({r['branch'] or '-'}): {', '.join(r['flags'])}")
+
+if __name__ == "__main__":
+    main()
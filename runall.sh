@@ -1,28 +1,7 @@
 #!/bin/bash
 
-# Base command
-base_cmd="python customPlot.py"
+# Generates the per-model plots for every $1/*/*/ directory and the unified
+# plots for every $1/* campaign. The work is fanned out across all cores by
+# runCampaigns.py; extra arguments (e.g. -j 4, --timeout 300) are passed on.
 
-# Directory pattern
-dir_pattern="$1/*/*/"
-
-# Find all matching directories and execute the Python script
-for dir in $dir_pattern; do
-    if [ -d "$dir" ]; then
-        echo "Executing in directory: $dir"
-        $base_cmd "$dir"
-        echo "------------------------"
-    fi
-done
-
-base_cmd2="python customOverallplot.py"
-
-dir_pat="$1/*"
-
-for dir in $dir_pat; do
-    if [ -d "$dir" ]; then
-        echo "executing dir $dir" 
-        $base_cmd2 "$dir/*"
-        echo "------------------------"
-    fi
-done
\ No newline at end of file
+python runCampaigns.py "$@"
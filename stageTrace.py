@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+
+# Opt-in per-stage instrumentation for the plotting scripts
+#
+#     with stage('load', dir=dirPath):
+#         data = read_csv_cached(inFile)
+#
+# Disabled (the default), stage() returns a shared no-op context manager.
+# With PLOT_TRACE=<file> (or PLOT_TRACE=1 for traceFile) every stage appends
+# one JSON line to the trace file: wall and CPU time, peak RSS of the
+# process, peak traced allocation (tracemalloc) and the net number of
+# allocated memory blocks, plus the labels. Stages nest and their times
+# include those of nested stages. Forked workers append to the same file;
+# the process that started tracing prints a summary table of the whole run
+# at exit.
+
+import atexit
+import contextlib
+import json
+import os
+import sys
+import time
+
+###### Settings go here ######
+
+traceFile       = 'plot_trace.jsonl'
+
+# tracemalloc slows allocation-heavy stages down; PLOT_TRACE_MEMORY=0 skips it
+traceMemory     = os.environ.get('PLOT_TRACE_MEMORY', '1') != '0'
+
+###### Don't edit below here ######
+
+_setting = os.environ.get('PLOT_TRACE', '')
+enabled  = _setting not in ('', '0')
+_path    = (traceFile if _setting == '1' else _setting) if enabled else None
+
+_noop    = contextlib.nullcontext()
+_stack   = []
+
+
+def _max_rss_kb():
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss     # bytes on macOS
+
+class _Stage:
+    __slots__ = ('name', 'labels', 'start', 'wall', 'cpu', 'blocks', 'peak')
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        if traceMemory:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            # Hand the peak so far to the enclosing stage before resetting it
+            current, peak = tracemalloc.get_traced_memory()
+            if _stack:
+                _stack[-1].peak = max(_stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+            self.peak = current
+        _stack.append(self)
+        self.blocks = sys.getallocatedblocks()
+        self.start = time.time()
+        self.cpu = time.process_time()
+        self.wall = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        blocks = sys.getallocatedblocks() - self.blocks
+        _stack.pop()
+        record = {'run': os.environ.get('PLOT_TRACE_RUN'), 'pid': os.getpid(),
+                  'stage': self.name, 'depth': len(_stack),
+                  'parent': _stack[-1].name if _stack else None,
+                  'start': round(self.start, 6), 'wall': round(wall, 6),
+                  'cpu': round(cpu, 6), 'maxRssKb': _max_rss_kb(), 'blocks': blocks}
+        if traceMemory:
+            import tracemalloc
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(self.peak, peak)
+            record['tracedPeak'] = peak
+            if _stack:
+                _stack[-1].peak = max(_stack[-1].peak, peak)
+        record.update({k: str(v) for k, v in self.labels.items()})
+        with open(_path, 'a') as fp:
+            fp.write(json.dumps(record) + '\n')
+        return False
+
+def stage(name, **labels):
+    '''Context manager timing the named stage; labels (e.g. dir=, figure=)
+    are stored with the record'''
+    if not enabled:
+        return _noop
+    return _Stage(name, labels)
+
+def read_trace(path, run=None):
+    '''Trace records of path, optionally only those of one run'''
+    records = []
+    with open(path) as fp:
+        for line in fp:
+            record = json.loads(line)
+            if run is None or record.get('run') == run:
+                records.append(record)
+    return records
+
+def summary(records):
+    '''Per-stage totals: count, wall, CPU, max RSS and max traced peak'''
+    table = {}
+    for r in records:
+        row = table.setdefault(r['stage'], {'count': 0, 'wall': 0., 'cpu': 0.,
+                                            'maxRssKb': 0, 'tracedPeak': 0})
+        row['count'] += 1
+        row['wall'] += r['wall']
+        row['cpu'] += r['cpu']
+        row['maxRssKb'] = max(row['maxRssKb'], r['maxRssKb'])
+        row['tracedPeak'] = max(row['tracedPeak'], r.get('tracedPeak', 0))
+    return table
+
+def print_summary(records, out=sys.stderr):
+    table = summary(records)
+    print(f"{'stage':16s} {'count':>6s} {'wall s':>9s} {'cpu s':>9s} "
+          f"{'max rss MB':>11s} {'peak alloc MB':>14s}", file=out)
+    for name, row in sorted(table.items(), key=lambda kv: -kv[1]['wall']):
+        print(f"{name:16s} {row['count']:6d} {row['wall']:9.3f} {row['cpu']:9.3f} "
+              f"{row['maxRssKb'] / 1024:11.1f} {row['tracedPeak'] / 2**20:14.1f}", file=out)
+
+def _report():
+    if os.path.exists(_path):
+        records = read_trace(_path, os.environ.get('PLOT_TRACE_RUN'))
+        if records:
+            print(f"Stage trace written to {_path}", file=sys.stderr)
+            print_summary(records)
+
+if enabled and 'PLOT_TRACE_RUN' not in os.environ:
+    # The first traced process owns the run: workers inherit the run id and
+    # only this process prints the summary
+    os.environ['PLOT_TRACE_RUN'] = f'{os.getpid()}-{int(time.time())}'
+    atexit.register(_report)
+
+
+def parse_arguments():
+    import argparse
+    parser = argparse.ArgumentParser(description="Summarize a stage trace file")
+    parser.add_argument("trace", nargs='?', default=traceFile, help="Trace file (default: %(default)s)")
+    parser.add_argument("--run", help="Only this run id (default: every run)")
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    print_summary(read_trace(args.trace, args.run), sys.stdout)
+
+if __name__ == "__main__":
+    main()
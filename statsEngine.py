@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+
+# Vectorized statistics for the schedule queue metrics
+#
+# Computes the Mean, CI_Lower, CI_Upper, Median, Lower_Quartile and
+# Upper_Quartile of every group and every metric in one grouped pass,
+# returning numeric columns.
+#
+# The C.I. is Student's t-interval by default. ciMethod='percentile' or 'bca'
+# replaces it with a bootstrap interval of the mean: all groups of a frame
+# are resampled at once with index matrices drawn from a seeded RNG, in
+# fixed batches that can be spread over a process pool without changing
+# the result.
+
+import csv
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+###### Settings go here ######
+
+bootstrapResamples  = 10000
+bootstrapSeed       = 0
+bootstrapWorkers    = 0         # processes for the resampling, 0 = in process
+bootstrapBatchSize  = 1 << 22   # resampled values drawn per batch (memory bound)
+
+###### Don't edit below here ######
+
+ciMethods       = ('t', 'percentile', 'bca')
+
+statType        = [ 'Mean',
+                    'CI_Lower',
+                    'CI_Upper',
+                    'Median',
+                    'Lower_Quartile',
+                    'Upper_Quartile'
+                  ]
+
+
+@lru_cache(maxsize=None)
+def t_critical(n, confidence=0.95):
+    '''Two-sided Student's t critical value for a sample of size n'''
+    import scipy.stats as sps
+    return float(sps.t.ppf((1 + confidence) / 2., n - 1))
+
+def block_median(values, start, length):
+    '''Median of the sorted blocks values[start:start+length], per block'''
+    return (values[start + (length - 1) // 2] + values[start + length // 2]) / 2.
+
+def group_codes(frame, groupbyList):
+    '''Returns (codes, index) mapping each row to its group and the group
+    keys; rows with a missing key belong to no group (code -1)'''
+    grouped = frame.groupby(groupbyList, sort=True)
+    # ngroup() gives those rows NaN, so the codes come back as floats
+    codes = grouped.ngroup().to_numpy(dtype=float, na_value=np.nan)
+    codes = np.where(np.isnan(codes), -1, codes).astype(np.int64)
+    index = grouped.size().index
+    return codes, index
+
+def metric_stats(values, codes, ngroups, confidence=0.95):
+    '''Per-group statistics of one metric, as a (ngroups x len(statType)) array'''
+    values = np.asarray(values, dtype=float)
+
+    # Sort by group first and value second, so that each group occupies a
+    # contiguous sorted block starting at offsets[g]
+    order   = np.lexsort((values, codes))
+    ordered = values[order]
+    counts  = np.bincount(codes, minlength=ngroups)
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    sums  = np.bincount(codes, weights=values, minlength=ngroups)
+    mean  = sums / counts
+    dev   = values - mean[codes]
+    ssd   = np.bincount(codes, weights=dev * dev, minlength=ngroups)
+
+    out = np.empty((ngroups, len(statType)))
+    single = counts < 2
+    multi  = ~single
+
+    # A single sample carries no spread: every statistic is that sample
+    out[single, :] = ordered[offsets[single], None]
+
+    if multi.any():
+        n   = counts[multi]
+        off = offsets[multi]
+        m   = mean[multi]
+        sem = np.sqrt(ssd[multi] / (n - 1)) / np.sqrt(n)
+        tcrit = np.array([t_critical(int(k), confidence) for k in n])
+        h = sem * tcrit
+
+        # Quartiles: median of the lower half and of the upper half,
+        # excluding the middle sample when the count is odd
+        mid = n // 2
+        upperStart = off + mid + (n % 2)
+
+        out[multi, 0] = m
+        out[multi, 1] = m - h
+        out[multi, 2] = m + h
+        out[multi, 3] = block_median(ordered, off, n)
+        out[multi, 4] = block_median(ordered, off, mid)
+        out[multi, 5] = block_median(ordered, upperStart, mid)
+
+    return out
+
+def _resample_means(values, codes, counts, offsets, resamples, seed):
+    '''Bootstrap means of every group, (resamples x ngroups x nmetrics).
+    values are (rows x nmetrics) sorted by group code.'''
+    rng = np.random.default_rng(seed)
+    rowCounts  = counts[codes]
+    rowOffsets = offsets[codes]
+    # Each row position of a group draws a row of the same group
+    index = rowOffsets + (rng.random((resamples, len(codes))) * rowCounts).astype(np.int64)
+    sums = np.add.reduceat(values[index], offsets, axis=1)
+    return sums / counts[None, :, None]
+
+def _resample_batch(args):
+    return _resample_means(*args)
+
+def bootstrap_ci(values, codes, ngroups, confidence=0.95, method='percentile',
+                 resamples=None, seed=None, workers=None):
+    '''Bootstrap C.I. of the mean of every group and metric.
+
+    values is (rows x nmetrics), codes the group of each row. Returns
+    (lower, upper), each (ngroups x nmetrics). Groups of one sample get that
+    sample as both bounds. method is 'percentile' or 'bca'.'''
+    import scipy.special as spsp
+    resamples = bootstrapResamples if resamples is None else resamples
+    seed      = bootstrapSeed if seed is None else seed
+    workers   = bootstrapWorkers if workers is None else workers
+
+    values = np.asarray(values, dtype=float)
+    if values.ndim == 1:
+        values = values[:, None]
+    order  = np.argsort(codes, kind='stable')
+    values = values[order]
+    codes  = np.asarray(codes)[order]
+    counts = np.bincount(codes, minlength=ngroups)
+    if (counts == 0).any():
+        raise RuntimeError('bootstrap_ci - empty group')
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    # Fixed batches with their own seeds: same result for any worker count
+    batch = max(1, min(resamples, bootstrapBatchSize // max(1, values.size)))
+    sizes = [min(batch, resamples - start) for start in range(0, resamples, batch)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    jobs  = [(values, codes, counts, offsets, size, child) for size, child in zip(sizes, seeds)]
+    if workers and len(jobs) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            boot = np.concatenate(list(pool.map(_resample_batch, jobs)))
+    else:
+        boot = np.concatenate([_resample_batch(job) for job in jobs])
+
+    alpha = (1 - confidence) / 2.
+    if method == 'percentile':
+        lower, upper = np.quantile(boot, [alpha, 1 - alpha], axis=0)
+    elif method == 'bca':
+        mean = np.add.reduceat(values, offsets, axis=0) / counts[:, None]
+
+        # Bias correction from the share of resampled means below the mean
+        below = (boot < mean).mean(axis=0)
+        below = np.clip(below, 1. / (resamples + 1), resamples / (resamples + 1.))
+        z0 = spsp.ndtri(below)
+
+        # Acceleration from the jackknife means (leave one row out)
+        rowCounts = counts[codes][:, None]
+        jack = (mean[codes] * rowCounts - values) / np.maximum(rowCounts - 1, 1)
+        dev  = np.add.reduceat(jack, offsets, axis=0) / counts[:, None]
+        dev  = dev[codes] - jack
+        num  = np.add.reduceat(dev ** 3, offsets, axis=0)
+        den  = 6. * np.add.reduceat(dev ** 2, offsets, axis=0) ** 1.5
+        accel = np.divide(num, den, out=np.zeros_like(num), where=den > 0)
+
+        ordered = np.sort(boot, axis=0)
+        bounds = []
+        for z in spsp.ndtri([alpha, 1 - alpha]):
+            level = spsp.ndtr(z0 + (z0 + z) / (1 - accel * (z0 + z)))
+            # Per group and metric quantile of the sorted resampled means
+            rank = np.clip(np.round(level * (resamples - 1)).astype(np.int64), 0, resamples - 1)
+            bounds.append(np.take_along_axis(ordered, rank[None], axis=0)[0])
+        lower, upper = bounds
+    else:
+        raise ValueError(f'bootstrap_ci - unknown method {method}')
+
+    single = counts < 2
+    lower[single] = values[offsets[single]]
+    upper[single] = values[offsets[single]]
+    return lower, upper
+
+def compute_stats(frame, groupbyList, metrics, confidence=0.95, ciMethod='t'):
+    '''Returns a numeric frame indexed by the group keys with one
+    <metric>_<stat> column per metric and statistic. ciMethod selects the
+    C.I.: 't', or a bootstrap 'percentile' / 'bca' interval.'''
+    if frame.empty:
+        raise RuntimeError('compute_stats - no data points passed')
+
+    codes, index = group_codes(frame, groupbyList)
+    ngroups = len(index)
+
+    # Rows with a missing group key are left out (code -1)
+    keep = codes >= 0
+    codes = codes[keep]
+
+    if ciMethod not in ciMethods:
+        raise ValueError(f'compute_stats - unknown ciMethod {ciMethod}')
+    if ciMethod != 't' and metrics:
+        # One set of resampling indices serves every metric
+        values = frame[metrics].to_numpy(dtype=float)[keep]
+        lower, upper = bootstrap_ci(values, codes, ngroups, confidence, ciMethod)
+
+    columns = {}
+    for j, metric in enumerate(metrics):
+        values = frame[metric].to_numpy()[keep]
+        block = metric_stats(values, codes, ngroups, confidence)
+        if ciMethod != 't':
+            block[:, 1] = lower[:, j]
+            block[:, 2] = upper[:, j]
+        for i, stat in enumerate(statType):
+            columns[metric + '_' + stat] = block[:, i]
+
+    return pd.DataFrame(columns, index=index)
+
+def stats_table(result):
+    '''The stats frame as it appears in the stats csv: group keys as columns'''
+    return result.reset_index()
+
+def write_stats(table, outFile):
+    '''Writes a stats table in one pass: header, numeric rows, no quoting'''
+    table.to_csv(outFile, index=False, quoting=csv.QUOTE_NONE)
+
+def shape_stats(table, xaxisLabel, keyLabel, metrics):
+    '''Reshapes a stats table for plotting in one step.
+
+    Returns {key: {'x': xs, metric: {stat: values}}} with NumPy arrays in
+    ascending x order per keyLabel value. Numeric x columns sort
+    numerically, anything else lexically.'''
+    ordered = table.sort_values([keyLabel, xaxisLabel], kind='mergesort')
+    columns = [metric + '_' + stat for metric in metrics for stat in statType]
+    values  = ordered[columns].to_numpy(dtype=float)
+    xs      = ordered[xaxisLabel].to_numpy()
+    keys    = ordered[keyLabel].to_numpy()
+
+    # Rows of one key are contiguous after the sort
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else []
+    ends   = np.r_[starts[1:], len(keys)] if len(keys) else []
+
+    shaped = {}
+    for start, end in zip(starts, ends):
+        series = {'x': xs[start:end]}
+        for i, metric in enumerate(metrics):
+            block = values[start:end, i * len(statType):(i + 1) * len(statType)]
+            series[metric] = {stat: block[:, j] for j, stat in enumerate(statType)}
+        shaped[keys[start]] = series
+    return shaped
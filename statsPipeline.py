@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+
+# Stats csv and error-bar figures of a run set, shared by temp.py and
+# plotScheduleQ.py
+#
+#     import temp as pipeline
+#     statsPipeline.calc_and_plot(pipeline, dirPath)
+#
+# pipeline is the script holding the settings (searchAttrsList, metricList,
+# rawDataFileName, ciMethod, streamThresholdMB, excludeRuns, baselineRoots,
+# multiPagePdf, multiPageName; see temp.py) and a module-level plot_stats for
+# the render pool. Each run of calc_and_plot:
+#     - skips everything when the manifest says the inputs, the settings and
+#       the scripts are unchanged (plotManifest.py)
+#     - loads the sequential baselines (baselineStore.py) and the run log
+#       (runLog.py), whose excluded rows are left out
+#     - reads the rows once, or aggregates them chunk by chunk above
+#       streamThresholdMB (streamStats.py), and derives the metrics
+#     - writes the stats csv of every filter value whose rows changed
+#       (statsEngine.py) and renders the figures whose stats changed
+#       (statsRenderer.py)
+#
+# Heavy modules (pandas, scipy, matplotlib) are imported by the stage that
+# needs them, so up-to-date directories return without paying for them.
+
+import os, sys
+from importlib.util import find_spec
+from baselineStore import load_baselines
+from derivedMetrics import derive, raw_inputs
+from plotManifest import Manifest, digest, file_digest, frame_digest, script_version
+from runLog import apply_run_log, load_run_log
+from stageTrace import stage
+
+
+def raw_columns(pipeline):
+    '''Raw csv columns needed by the groupings, filters and metrics'''
+    from rawSchema import columnTypes
+    columns = set()
+    for searchAttrs in pipeline.searchAttrsList:
+        columns.update(searchAttrs['groupby'])
+        columns.update(searchAttrs[key] for key in ('filter', 'model', 'lpcount'))
+    columns.update(raw_inputs([param['name'] for param in pipeline.metricList]))
+    return [c for c in columnTypes if c in columns]
+
+def add_derived_metrics(pipeline, data, workloads):
+    # Derived metrics of metricList (see derivedMetrics.py), computed on the
+    # whole frame or on each streamed chunk
+    return derive(data, [param['name'] for param in pipeline.metricList], workloads)
+
+def plot_stats(pipeline, dirPath, fileName, xaxisLabel, keyLabel, filterLabel, filterValue, model, lpCount,
+               params=None, pages=None, stats=None):
+    '''Error-bar figures of the metrics params (default: metricList) of one
+    stats table, read from its csv unless given'''
+    import pandas as pd
+    from statsEngine import shape_stats, statType
+    from statsRenderer import render_errorbars
+
+    # Use the in-memory stats table if given, else read the stats csv
+    if stats is None:
+        inFile = os.path.join(dirPath, 'stats', pipeline.rawDataFileName, f'{fileName}.csv')
+        with stage('load', dir=dirPath, figure=fileName):
+            stats = pd.read_csv(inFile)
+
+    # Reshape once into per-key arrays for every requested metric
+    params = pipeline.metricList if params is None else params
+    with stage('reshape', dir=dirPath, figure=fileName):
+        shaped = shape_stats(stats, xaxisLabel, keyLabel, [param['name'] for param in params])
+
+    for param in params:
+        metric = param['name']
+        outData = {'header': {key: series['x'] for key, series in shaped.items()}}
+        for stat in statType:
+            outData[stat] = {key: series[metric][stat] for key, series in shaped.items()}
+
+        # Plot the statistical data
+        title = f"{model.upper()} model with {lpCount:,} LPs"
+        subtitle = f"{filterLabel} = {str(filterValue).upper()} , key = {keyLabel}"
+        outDir = os.path.join(dirPath, 'plots', pipeline.rawDataFileName)
+        outFile = os.path.join(outDir, f"{fileName}_{metric}.pdf")
+        yaxisLabel = f"{metric}_(C.I._=_95%)"
+        render_errorbars(outData, outFile, title, subtitle, xaxisLabel, yaxisLabel, '', pages)
+
+def calc_and_plot(pipeline, dirPath, plots=True, read=None):
+    '''Brings the stats and figures of dirPath up to date; returns the stats
+    tables it rebuilt, keyed by csv path.
+    plots=False only brings the stats up to date (e.g. for campaignReport.py);
+    the figures are left stale for the next plotting run. read(path, columns)
+    replaces read_raw, e.g. to take the rows from a frame already loaded
+    (plotAll.py); the csv is then never streamed.'''
+    rawDataFileName = pipeline.rawDataFileName
+    searchAttrsList = pipeline.searchAttrsList
+    metricList      = pipeline.metricList
+    ciMethod        = pipeline.ciMethod
+    excludeRuns     = pipeline.excludeRuns
+
+    # Load data from csv file
+    inFile = os.path.join(dirPath, f'{rawDataFileName}.csv')
+    if not os.path.exists(inFile):
+        print(f'{rawDataFileName.upper()} raw data not available')
+        sys.exit(1)
+
+    # Sequential baselines of the speedup, checked against the runs
+    baselines = load_baselines(dirPath, pipeline.baselineRoots)
+    for warning in baselines['warnings']:
+        print(warning)
+
+    # Join the run logs to the rows (indexed in .runlog.json)
+    runLog = load_run_log(dirPath)
+
+    # Skip everything if neither the inputs, the settings nor the scripts changed
+    manifest = Manifest(dirPath, os.path.join(dirPath, 'stats', rawDataFileName + '.manifest.json'))
+    version = script_version(pipeline.__file__, __file__, find_spec('statsEngine').origin,
+                             find_spec('streamStats').origin, find_spec('runLog').origin,
+                             find_spec('baselineStore').origin,
+                             find_spec('derivedMetrics').origin,
+                             find_spec('statsRenderer').origin,
+                             find_spec('rawSchema').origin)
+    inputsKey = digest(file_digest(inFile), baselines['key'],
+                       searchAttrsList, metricList, ciMethod, pipeline.multiPagePdf,
+                       runLog['rows'], excludeRuns, version)
+    if manifest.is_current(inputsKey):
+        print(f'{rawDataFileName.upper()} stats and plots are up to date')
+        return {}
+
+    from baselineStore import workload_stats
+    from rawSchema import read_args, read_raw
+    from statsEngine import compute_stats, stats_table, write_stats
+    from statsRenderer import render_figures
+    from streamStats import StreamingStats, stream_stats
+
+    workloads = workload_stats(baselines)
+    streaming = read is None and \
+        os.path.getsize(inFile) > pipeline.streamThresholdMB * 1024 * 1024
+    if streaming:
+        # Aggregate chunk by chunk: running moments plus reservoir quantiles
+        accumulators = [StreamingStats(list(searchAttrs['groupby']) + [searchAttrs['filter']],
+                                       [param['name'] for param in metricList])
+                        for searchAttrs in searchAttrsList]
+        firstColumns = [c for searchAttrs in searchAttrsList
+                          for c in (searchAttrs['model'], searchAttrs['lpcount'])]
+        with stage('load', dir=dirPath, mode='stream'):
+            first = stream_stats(inFile, accumulators,
+                                 lambda chunk: add_derived_metrics(
+                                     pipeline, apply_run_log(chunk, runLog, excludeRuns), workloads),
+                                 firstColumns,
+                                 **read_args(inFile, raw_columns(pipeline)))
+    else:
+        with stage('load', dir=dirPath):
+            # Typed and pruned to the columns in use; fails on schema drift
+            data = (read or read_raw)(inFile, raw_columns(pipeline))
+            # Leave out failed and misconfigured runs
+            data = apply_run_log(data, runLog, excludeRuns)
+        with stage('derive', dir=dirPath):
+            add_derived_metrics(pipeline, data, workloads)
+
+    # Create the plots and stats directories (if needed); outputs that are
+    # no longer produced are removed by the manifest at the end
+    plotDir = os.path.join(dirPath, 'plots', rawDataFileName)
+    os.makedirs(plotDir, exist_ok=True)
+
+    outName = os.path.join(dirPath, 'stats', rawDataFileName)
+    os.makedirs(outName, exist_ok=True)
+
+    figures = []
+    tables = {}
+    for i, searchAttrs in enumerate(searchAttrsList):
+        groupbyList = list(searchAttrs['groupby'])
+        filterName  = searchAttrs['filter']
+        model       = searchAttrs['model']
+        lpcount     = searchAttrs['lpcount']
+        output      = searchAttrs['output']
+
+        groupbyList.append(filterName)
+
+        if streaming:
+            filterValues = accumulators[i].filter_values(filterName)
+            modelName = [first[model]]
+            lpCount   = [first[lpcount]]
+        else:
+            # Read unique values for the filter
+            filterValues = data[filterName].unique().tolist()
+
+            # Read the model name and LP count
+            modelName = data[model].unique().tolist()
+            lpCount   = data[lpcount].unique().tolist()
+
+        for filterValue in filterValues:
+            fileName = f"{output}{filterValue}"
+            outFile = os.path.join(outName, f'{fileName}.csv')
+
+            if streaming:
+                metrics = accumulators[i].metrics
+                statsKey = digest(inputsKey, fileName)
+            else:
+                # Filter data for each filterValue
+                filteredData = data[data[filterName] == filterValue]
+                metrics = []
+                for param in metricList:
+                    metric = param['name']
+                    if metric not in filteredData.columns:
+                        print(f"Error processing metric {metric}: column not available")
+                        continue  # Skip to the next metric if it is not available
+                    metrics.append(metric)
+                # Only the columns in use, however many more the frame holds
+                statsKey = digest(frame_digest(filteredData[groupbyList + metrics]),
+                                  groupbyList, metrics, ciMethod, version)
+
+            if manifest.needs_build(outFile, statsKey):
+                # Generate stats for every metric in one grouped pass
+                with stage('stats', dir=dirPath, figure=fileName):
+                    if streaming:
+                        result = accumulators[i].result(filterName, filterValue, ciMethod=ciMethod)
+                    else:
+                        result = compute_stats(filteredData, groupbyList, metrics, ciMethod=ciMethod)
+                    table = stats_table(result)
+
+                # Write to the csv and keep the table for plotting
+                with stage('write', dir=dirPath, figure=fileName):
+                    write_stats(table, outFile)
+                tables[fileName] = table
+            manifest.record(outFile, statsKey)
+
+            if not plots:
+                continue
+
+            # Queue the figures of this stats file for rendering
+            entries = []
+            for param in metricList:
+                plotFile = os.path.join(plotDir, f"{fileName}_{param['name']}.pdf")
+                plotKey = digest(statsKey, param, modelName[0], lpCount[0])
+                entries.append((param, plotFile, plotKey))
+            statsArgs = (fileName, groupbyList[0], groupbyList[1],
+                         filterName, filterValue, modelName[0], lpCount[0])
+            figures.append((statsArgs, entries))
+
+    if plots:
+        # Plot only the statistics whose figure inputs changed
+        multiPageFile = os.path.join(plotDir, pipeline.multiPageName) if pipeline.multiPagePdf else None
+        render_figures(dirPath, figures, manifest, pipeline.plot_stats, multiPageFile, tables)
+
+        manifest.finish(inputsKey)
+    else:
+        manifest.checkpoint()
+    return {os.path.join(outName, f'{fileName}.csv'): table for fileName, table in tables.items()}
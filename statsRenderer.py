@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+# Renderer for the schedule queue statistics figures
+#
+# Draws the yerrorlines figures (mean with C.I. error bars per key) straight
+# to PDF with matplotlib's object-oriented API, replacing the Gnuplot SVG +
+# Inkscape conversion. Separate figures are rendered across the renderPool
+# processes; figures appended as pages of a single multi-page PDF per
+# directory are drawn one after the other in this process.
+
+import numpy as np
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.figure import Figure
+
+from renderPool import render_all
+from stageTrace import stage
+
+###### Settings go here ######
+
+figureSize      = (10, 8)       # inches, 1000x800 at 100 dpi like the svg terminal
+fontSize        = 16
+keyFontSize     = 12
+
+###### Don't edit below here ######
+
+def _numeric(values):
+    '''Numeric x values where possible, else the labels themselves'''
+    try:
+        return [float(v) for v in values]
+    except (TypeError, ValueError):
+        return [str(v) for v in values]
+
+def draw_errorbars(fig, data, title, subtitle, xaxisLabel, yaxisLabel, linePreface=''):
+    '''Draws one line with error bars per key of data, where data holds
+    'header' (x values), 'Mean', 'CI_Lower' and 'CI_Upper' keyed by key'''
+    ax = fig.add_subplot(1, 1, 1)
+    keys = sorted(data['Mean'])
+    for key in keys:
+        x     = _numeric(data['header'][key])
+        mean  = np.asarray(data['Mean'][key], dtype=float)
+        lower = mean - np.asarray(data['CI_Lower'][key], dtype=float)
+        upper = np.asarray(data['CI_Upper'][key], dtype=float) - mean
+        ax.errorbar(x, mean, yerr=[lower, upper], fmt='-o', capsize=4,
+                    label=linePreface + str(key))
+
+    ax.set_xlabel(xaxisLabel.replace('_', ' '), fontsize=fontSize)
+    ax.set_ylabel(yaxisLabel.replace('_', ' '), fontsize=fontSize)
+    ax.grid(True)
+
+    # Key box above the plot area, centred and horizontal
+    columns = max(1, min(len(keys), 6))
+    rows = (len(keys) + columns - 1) // columns
+    if keys:
+        ax.legend(loc='lower center', bbox_to_anchor=(0.5, 1.01), ncol=columns,
+                  frameon=True, edgecolor='black', fontsize=keyFontSize)
+    ax.set_title(title.replace('_', ' ') + '\n' + subtitle.replace('_', ' '),
+                 fontsize=fontSize, pad=12 + 22 * rows)
+    return ax
+
+def render_errorbars(data, fileName, title, subtitle, xaxisLabel, yaxisLabel,
+                     linePreface='', pages=None):
+    '''Renders one figure to fileName, or as a new page of pages (PdfPages)'''
+    with stage('render', figure=fileName):
+        fig = Figure(figsize=figureSize)
+        draw_errorbars(fig, data, title, subtitle, xaxisLabel, yaxisLabel, linePreface)
+    with stage('convert', figure=fileName):
+        if pages is not None:
+            pages.savefig(fig, bbox_inches='tight')
+        else:
+            fig.savefig(fileName, bbox_inches='tight')
+
+def render_figures(dirPath, figures, manifest, plotStats, multiPageFile=None, tables=None):
+    '''Renders the figures of a directory, skipping those that are current.
+
+    figures is a list of (statsArgs, [(param, plotFile, plotKey), ...]) where
+    plotStats(dirPath, *statsArgs, params, pages) draws the given metrics of
+    one stats file. With multiPageFile, every figure becomes a page of that
+    single PDF, which is rebuilt whenever any of its figures changed.
+    tables maps stats file names to in-memory stats tables, passed to
+    plotStats as stats= so it does not re-read the csv. Separate figures are
+    drawn by the render pool, so plotStats must be a module-level function.'''
+    tables = tables or {}
+    if multiPageFile:
+        from plotManifest import digest
+        pdfKey = digest([key for _, entries in figures for _, _, key in entries])
+        if manifest.needs_build(multiPageFile, pdfKey):
+            with PdfPages(multiPageFile) as pages:
+                for statsArgs, entries in figures:
+                    plotStats(dirPath, *statsArgs, [e[0] for e in entries], pages,
+                              stats=tables.get(statsArgs[0]))
+        manifest.record(multiPageFile, pdfKey)
+        return
+
+    # One job per stale figure, rendered across the pool (see renderPool.py)
+    jobs = []
+    for statsArgs, entries in figures:
+        for param, plotFile, plotKey in entries:
+            if manifest.needs_build(plotFile, plotKey):
+                jobs.append((plotStats, (dirPath, *statsArgs, [param]),
+                             {'stats': tables.get(statsArgs[0])}))
+    render_all(jobs)
+    for _, entries in figures:
+        for _, plotFile, plotKey in entries:
+            manifest.record(plotFile, plotKey)
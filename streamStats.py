@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+# Streaming (chunked) statistics for raw csv files too large for memory
+#
+# The raw csv is read in chunks of chunkRows rows. Each group keeps running
+# moments (count, mean, M2; merged with Chan's parallel update) for the mean
+# and C.I., and a fixed-size reservoir sample of each metric for the median
+# and quartiles. Groups with at most reservoirSize rows keep every sample, so
+# their statistics are exactly those of statsEngine.compute_stats; larger
+# groups get sampled quantiles and always the t-interval (a bootstrap of the
+# reservoir would understate their sample size). Peak memory depends on chunkRows,
+# reservoirSize and the number of groups, not on the file size.
+
+import numpy as np
+import pandas as pd
+
+from statsEngine import bootstrap_ci, metric_stats, statType, t_critical
+
+###### Settings go here ######
+
+chunkRows       = 100000
+reservoirSize   = 4096
+
+###### Don't edit below here ######
+
+class GroupState:
+    __slots__ = ('count', 'mean', 'm2', 'reservoir', 'filled')
+
+    def __init__(self, nMetrics, size):
+        self.count = 0
+        self.mean = np.zeros(nMetrics)
+        self.m2 = np.zeros(nMetrics)
+        self.reservoir = np.empty((size, nMetrics))
+        self.filled = 0
+
+
+class StreamingStats:
+    '''Online per-group statistics of metrics grouped by groupbyList'''
+
+    def __init__(self, groupbyList, metrics, reservoirSize=reservoirSize, seed=0):
+        self.groupbyList = list(groupbyList)
+        self.metrics = list(metrics)
+        self.reservoirSize = reservoirSize
+        self.rng = np.random.default_rng(seed)
+        self.groups = {}        # insertion order = order of first appearance
+        self.checked = False
+
+    def update(self, chunk):
+        if not self.checked:
+            # Skip metrics that are not available, like calc_and_plot does
+            for metric in self.metrics:
+                if metric not in chunk.columns:
+                    print(f"Error processing metric {metric}: column not available")
+            self.metrics = [m for m in self.metrics if m in chunk.columns]
+            self.checked = True
+
+        values = chunk[self.metrics].to_numpy(dtype=float)
+        grouped = chunk.groupby(self.groupbyList, sort=False)
+        for key, rows in grouped.indices.items():
+            key = key if isinstance(key, tuple) else (key,)
+            state = self.groups.get(key)
+            if state is None:
+                state = self.groups[key] = GroupState(len(self.metrics), self.reservoirSize)
+            self._merge(state, values[rows])
+
+    def _merge(self, state, block):
+        # Moments: Chan et al. pairwise update
+        n = len(block)
+        blockMean = block.mean(axis=0)
+        blockM2 = ((block - blockMean) ** 2).sum(axis=0)
+        total = state.count + n
+        delta = blockMean - state.mean
+        state.mean = state.mean + delta * n / total
+        state.m2 = state.m2 + blockM2 + delta * delta * state.count * n / total
+
+        # Reservoir (Algorithm R): fill first, then replace with probability K/seen
+        size = self.reservoirSize
+        take = min(size - state.filled, n)
+        if take > 0:
+            state.reservoir[state.filled:state.filled + take] = block[:take]
+            state.filled += take
+        rest = block[take:]
+        if len(rest):
+            seen = state.count + take + np.arange(1, len(rest) + 1)
+            slots = (self.rng.random(len(rest)) * seen).astype(np.int64)
+            keep = slots < size
+            state.reservoir[slots[keep]] = rest[keep]
+        state.count = total
+
+    def filter_values(self, filterName):
+        '''Values of a grouping column in order of first appearance'''
+        level = self.groupbyList.index(filterName)
+        return list(dict.fromkeys(key[level] for key in self.groups))
+
+    def result(self, filterName=None, filterValue=None, confidence=0.95, ciMethod='t'):
+        '''Stats frame in the layout of statsEngine.compute_stats, optionally
+        restricted to the groups where filterName == filterValue'''
+        keys = list(self.groups)
+        if filterName is not None:
+            level = self.groupbyList.index(filterName)
+            keys = [k for k in keys if k[level] == filterValue]
+        if not keys:
+            raise RuntimeError('result - no data points passed')
+        keys.sort()
+        states = [self.groups[k] for k in keys]
+
+        counts  = np.array([s.count for s in states])
+        filled  = np.array([s.filled for s in states])
+        codes   = np.repeat(np.arange(len(keys)), filled)
+        sampled = np.vstack([s.reservoir[:s.filled] for s in states])
+        exact   = counts == filled
+
+        if ciMethod != 't' and exact.any():
+            # Bootstrap C.I. for the groups that hold every sample
+            rows = exact[codes]
+            renumber = np.cumsum(exact) - 1
+            lower, upper = bootstrap_ci(sampled[rows], renumber[codes[rows]],
+                                        int(exact.sum()), confidence, ciMethod)
+
+        columns = {}
+        for i, metric in enumerate(self.metrics):
+            block = metric_stats(sampled[:, i], codes, len(keys), confidence)
+            if ciMethod != 't' and exact.any():
+                block[exact, 1] = lower[:, i]
+                block[exact, 2] = upper[:, i]
+
+            # Sampled groups: mean and C.I. from the running moments
+            if not exact.all():
+                n    = counts[~exact]
+                mean = np.array([s.mean[i] for s, e in zip(states, exact) if not e])
+                m2   = np.array([s.m2[i] for s, e in zip(states, exact) if not e])
+                h = np.sqrt(m2 / (n - 1)) / np.sqrt(n) * \
+                    np.array([t_critical(int(k), confidence) for k in n])
+                block[~exact, 0] = mean
+                block[~exact, 1] = mean - h
+                block[~exact, 2] = mean + h
+
+            for j, stat in enumerate(statType):
+                columns[metric + '_' + stat] = block[:, j]
+
+        if len(self.groupbyList) > 1:
+            index = pd.MultiIndex.from_tuples(keys, names=self.groupbyList)
+        else:
+            index = pd.Index([k[0] for k in keys], name=self.groupbyList[0])
+        return pd.DataFrame(columns, index=index)
+
+
+def stream_stats(inFile, accumulators, derive=None, firstColumns=(), rows=chunkRows, **kwargs):
+    '''Feeds inFile chunk by chunk into every StreamingStats accumulator.
+
+    derive(chunk) may add derived metric columns to each chunk in place or
+    return a new chunk (e.g. with rows dropped). Returns the first row's values of firstColumns (e.g. model, LP count).'''
+    first = {}
+    for chunk in pd.read_csv(inFile, chunksize=rows, **kwargs):
+        if derive is not None:
+            derived = derive(chunk)
+            chunk = chunk if derived is None else derived
+        if not first and len(chunk):
+            first = {c: chunk[c].iloc[0] for c in firstColumns}
+        for accumulator in accumulators:
+            accumulator.update(chunk)
+    return first
@@ -0,0 +1,16 @@
+import numpy as np
+import pandas as pd
+
+from statsEngine import compute_stats
+
+
+def test_missing_group_key_is_left_out():
+    # An empty queue type is read as NaN; those rows belong to no group
+    frame = pd.DataFrame({'branch': ['a', 'a', 'a', 'b', 'b'],
+                          'Schedule_Queue_Type': ['ladder', 'ladder', None, 'ladder', None],
+                          'Simulation_Runtime_(secs.)': [1., 3., 100., 5., 200.]})
+    stats = compute_stats(frame, ['branch', 'Schedule_Queue_Type'], ['Simulation_Runtime_(secs.)'])
+
+    assert list(stats.index) == [('a', 'ladder'), ('b', 'ladder')]
+    assert np.allclose(stats['Simulation_Runtime_(secs.)_Mean'], [2., 5.])
+    assert np.allclose(stats['Simulation_Runtime_(secs.)_Median'], [2., 5.])
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+
+# Watches a results tree and re-plots the schedule queue stats as rows arrive
+#
+#     python watchPlots.py completed_logs
+#
+# Every run set below the root (a directory with a scheduleq.csv) keeps the
+# streamStats accumulators of temp.py's groupings in memory. When a csv grows,
+# only the bytes appended since the last read are parsed (up to the last
+# complete line), the accumulators are updated with them, and only the
+# stats and figures of the filter values that received rows are rewritten.
+# New campaign and model directories are picked up as they appear.
+#
+# Changes are detected with inotify (Linux, through ctypes) and otherwise by
+# polling sizes every pollSecs. Bursts of changes are debounced: the figures
+# are refreshed once the tree has been quiet for debounceSecs, and at least
+# every maxDelaySecs while rows keep arriving. A truncated or replaced csv,
+# or a new sequential.dat, is re-read from the start.
+#
+# The run log (runLog.py) is applied to every chunk as temp.py applies it to
+# the whole file; when it changes its verdict on rows already read (e.g. a
+# build is marked failed later), the run set is re-read from the start.
+#
+# The figures are provisional: groups larger than the reservoir use sampled
+# quartiles. The stats and figures written here are dropped from temp.py's
+# manifest, so its next run rebuilds them.
+
+import argparse
+import os
+import sys
+import time
+
+from campaignCatalog import skipDirs
+from runLog import apply_run_log, flagged_rows, load_run_log
+from stageTrace import stage
+
+###### Settings go here ######
+
+debounceSecs    = 2.0       # refresh once no change was seen for this long
+maxDelaySecs    = 30.0      # ... but at least this often during a burst
+pollSecs        = 2.0       # polling interval without inotify
+
+tailBlockBytes  = 64 << 20  # appended bytes parsed per block
+
+rawDataFileName = 'scheduleq'
+
+###### Don't edit below here ######
+
+csvName         = rawDataFileName + '.csv'
+seqName         = 'sequential.dat'
+
+# inotify(7) event bits
+IN_MODIFY       = 0x00000002
+IN_CLOSE_WRITE  = 0x00000008
+IN_MOVED_TO     = 0x00000080
+IN_CREATE       = 0x00000100
+IN_Q_OVERFLOW   = 0x00004000
+IN_ISDIR        = 0x40000000
+watchMask       = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+
+def watched_dirs(root):
+    '''Directories below root that may hold run sets'''
+    for dirPath, dirNames, _ in os.walk(root):
+        dirNames[:] = sorted(d for d in dirNames if d not in skipDirs and not d.startswith('.'))
+        yield dirPath
+
+def find_csv_dirs(root):
+    return {d for d in watched_dirs(root) if os.path.exists(os.path.join(d, csvName))}
+
+
+def run_log_view(index, rows, exclude):
+    '''What the run log does to the first rows csv rows: the positions it
+    drops and the branch it fills in'''
+    flagged = [r for r in flagged_rows(index, exclude) if r < rows]
+    fills = [(r['first'], min(r['last'], rows - 1), r['branch']) for r in index['rows']
+             if 'unlabelled' in r['flags'] and r['branch'] and r['first'] < rows]
+    return flagged, fills
+
+
+class InotifySource:
+    '''Changed run set directories from inotify events'''
+
+    def __init__(self, root):
+        import ctypes
+        import ctypes.util
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.root = root
+        self.watches = {}
+        self.add_tree(root)
+
+    def add_tree(self, top):
+        import ctypes
+        for dirPath in watched_dirs(top):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dirPath), watchMask)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f'inotify_add_watch failed on {dirPath}')
+            self.watches[wd] = dirPath
+        return find_csv_dirs(top)
+
+    def wait(self, timeout):
+        import select
+        import struct
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            buffer = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return set()
+
+        changed = set()
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, _, size = struct.unpack_from('iIII', buffer, offset)
+            name = buffer[offset + 16:offset + 16 + size].rstrip(b'\0').decode(errors='replace')
+            offset += 16 + size
+            if mask & IN_Q_OVERFLOW:
+                return find_csv_dirs(self.root)
+            dirPath = self.watches.get(wd)
+            if dirPath is None:
+                continue
+            if mask & IN_ISDIR:
+                if name not in skipDirs and not name.startswith('.') and mask & (IN_CREATE | IN_MOVED_TO):
+                    # Watch the new directory first, then pick up what it already holds
+                    changed |= self.add_tree(os.path.join(dirPath, name))
+            elif name in (csvName, seqName):
+                changed.add(dirPath)
+        return changed
+
+
+class PollSource:
+    '''Changed run set directories from periodic scans of the tree'''
+
+    def __init__(self, root, interval=pollSecs):
+        self.root = root
+        self.interval = interval
+        self.states = self.scan()
+
+    def scan(self):
+        states = {}
+        for dirPath in find_csv_dirs(self.root):
+            state = []
+            for name in (csvName, seqName):
+                try:
+                    st = os.stat(os.path.join(dirPath, name))
+                    state.append((st.st_ino, st.st_size, st.st_mtime_ns))
+                except OSError:
+                    state.append(None)
+            states[dirPath] = state
+        return states
+
+    def wait(self, timeout):
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+        states = self.scan()
+        changed = {d for d, s in states.items() if self.states.get(d) != s}
+        self.states = states
+        return changed
+
+
+class RunSetWatch:
+    '''Incremental stats of one run set, fed with the rows appended to its csv'''
+
+    def __init__(self, dirPath, pipeline):
+        self.dirPath = dirPath
+        self.pipeline = pipeline
+        self.csvFile = os.path.join(dirPath, csvName)
+        self.runLog = None
+        self.reset()
+
+    def reset(self):
+        from baselineStore import load_baselines, workload_stats
+        from streamStats import StreamingStats
+        self.inode = None
+        self.offset = 0
+        self.header = None
+        self.readArgs = None
+        self.rows = 0
+        self.first = {}
+        self.seqState = self.read_seq_state()
+        baselines = load_baselines(self.dirPath, self.pipeline.baselineRoots)
+        for warning in baselines['warnings']:
+            print(warning, flush=True)
+        self.workloads = workload_stats(baselines)
+        self.accumulators = [StreamingStats(list(s['groupby']) + [s['filter']],
+                                            [param['name'] for param in self.pipeline.metricList])
+                             for s in self.pipeline.searchAttrsList]
+
+    def read_seq_state(self):
+        try:
+            st = os.stat(os.path.join(self.dirPath, seqName))
+            return st.st_ino, st.st_size, st.st_mtime_ns
+        except OSError:
+            return None         # no speedup until sequential.dat is written
+
+    def read_appended(self):
+        '''Yields frames of the complete rows appended since the last call'''
+        import io
+        import pandas as pd
+        from rawSchema import read_args
+
+        with open(self.csvFile, 'rb') as fp:
+            st = os.fstat(fp.fileno())
+            if self.inode is not None and (st.st_ino != self.inode or st.st_size < self.offset):
+                print(f"{self.csvFile} was replaced, re-reading it", flush=True)
+                self.reset()
+            self.inode = st.st_ino
+
+            if self.header is None:
+                header = fp.readline()
+                if not header.endswith(b'\n'):
+                    return
+                self.header = header
+                self.offset = len(header)
+
+            fp.seek(self.offset)
+            while True:
+                block = fp.read(tailBlockBytes)
+                end = block.rfind(b'\n')
+                if end < 0:
+                    return      # nothing new, or a line still being written
+                block = block[:end + 1]
+                self.offset += len(block)
+                fp.seek(self.offset)
+
+                if self.readArgs is None:
+                    # The first data row tells whether Model_Command is split
+                    self.readArgs = read_args(self.csvFile, self.pipeline.raw_columns())
+                chunk = pd.read_csv(io.BytesIO(self.header + block), **self.readArgs)
+                chunk.index = pd.RangeIndex(self.rows, self.rows + len(chunk))
+                self.rows += len(chunk)
+                yield chunk
+
+    def update(self):
+        '''Feeds the appended rows into the accumulators; returns the
+        (grouping index, filter value) pairs that received rows'''
+        affected = set()
+        for chunk in self.read_appended():
+            # Leave out failed and misconfigured runs, fill empty branches
+            chunk = apply_run_log(chunk, self.runLog, self.pipeline.excludeRuns)
+            self.pipeline.add_derived_metrics(chunk, self.workloads)
+            if not self.first and len(chunk):
+                self.first = {c: chunk[c].iloc[0] for s in self.pipeline.searchAttrsList
+                                                    for c in (s['model'], s['lpcount'])}
+            for i, (searchAttrs, accumulator) in enumerate(zip(self.pipeline.searchAttrsList,
+                                                               self.accumulators)):
+                accumulator.update(chunk)
+                affected.update((i, v) for v in chunk[searchAttrs['filter']].unique().tolist())
+        return affected
+
+    def render(self, affected):
+        '''Rewrites the stats csv and figures of the affected filter values'''
+        from plotManifest import Manifest
+        from renderPool import render_all
+        from statsEngine import stats_table, write_stats
+
+        pipeline = self.pipeline
+        statsDir = os.path.join(self.dirPath, 'stats', pipeline.rawDataFileName)
+        plotDir = os.path.join(self.dirPath, 'plots', pipeline.rawDataFileName)
+        os.makedirs(statsDir, exist_ok=True)
+        os.makedirs(plotDir, exist_ok=True)
+
+        jobs = []
+        written = []
+        for i, filterValue in sorted(affected, key=str):
+            searchAttrs = pipeline.searchAttrsList[i]
+            filterName = searchAttrs['filter']
+            groupbyList = list(searchAttrs['groupby']) + [filterName]
+            fileName = f"{searchAttrs['output']}{filterValue}"
+            outFile = os.path.join(statsDir, f'{fileName}.csv')
+            with stage('watch_stats', dir=self.dirPath, figure=fileName):
+                table = stats_table(self.accumulators[i].result(filterName, filterValue,
+                                                                ciMethod=pipeline.ciMethod))
+                write_stats(table, outFile)
+            # Same figure arguments as calc_and_plot
+            statsArgs = (self.dirPath, fileName, groupbyList[0], groupbyList[1], filterName,
+                         filterValue, self.first[searchAttrs['model']], self.first[searchAttrs['lpcount']])
+            jobs += [(pipeline.plot_stats, statsArgs + ([param],), {'stats': table})
+                     for param in pipeline.metricList]
+            written += [outFile] + [os.path.join(plotDir, f"{fileName}_{param['name']}.pdf")
+                                    for param in pipeline.metricList]
+
+        # The provisional outputs are not temp.py's: make its next run rebuild them
+        manifest = Manifest(self.dirPath, statsDir + '.manifest.json')
+        manifest.invalidate(written)
+        with stage('watch_render', dir=self.dirPath):
+            render_all(jobs)
+
+    def refresh(self):
+        '''Reads what was appended and re-plots what it touched'''
+        if self.read_seq_state() != self.seqState:
+            self.reset()    # the speedup of every row changes
+        runLog = load_run_log(self.dirPath)
+        exclude = self.pipeline.excludeRuns
+        if self.runLog is not None and self.rows and \
+                run_log_view(runLog, self.rows, exclude) != run_log_view(self.runLog, self.rows, exclude):
+            print(f"{self.dirPath}: run log changed for rows already read, re-reading", flush=True)
+            self.reset()
+        self.runLog = runLog
+        with stage('watch_update', dir=self.dirPath):
+            affected = self.update()
+        if affected:
+            self.render(affected)
+        return affected
+
+
+def watch(root, pipeline, poll=False, once=False):
+    '''Plots every run set below root, then keeps the figures current'''
+    source = None
+    if not poll:
+        try:
+            source = InotifySource(root)
+        except (OSError, AttributeError) as err:
+            print(f"inotify not available ({err}), polling every {pollSecs}s")
+    if source is None:
+        source = PollSource(root)
+
+    runSets = {}
+    pending = find_csv_dirs(root)
+    firstChange = lastChange = time.monotonic() - debounceSecs
+    while True:
+        now = time.monotonic()
+        if pending and (now - lastChange >= debounceSecs or now - firstChange >= maxDelaySecs):
+            for dirPath in sorted(pending):
+                if not os.path.exists(os.path.join(dirPath, csvName)):
+                    runSets.pop(dirPath, None)
+                    continue
+                runSet = runSets.get(dirPath)
+                if runSet is None:
+                    runSet = runSets[dirPath] = RunSetWatch(dirPath, pipeline)
+                try:
+                    affected = runSet.refresh()
+                except Exception as err:     # keep watching the other run sets
+                    print(f"{dirPath}: {err}", flush=True)
+                    runSets.pop(dirPath, None)
+                    continue
+                if affected:
+                    print(f"{time.strftime('%H:%M:%S')} {dirPath}: "
+                          f"{runSet.rows} rows, {len(affected)} stats files updated", flush=True)
+            pending = set()
+            if once:
+                return runSets
+
+        timeout = None
+        if pending:
+            timeout = max(0.0, min(lastChange + debounceSecs, firstChange + maxDelaySecs) - now)
+        changed = source.wait(timeout)
+        if changed:
+            now = time.monotonic()
+            if not pending:
+                firstChange = now
+            lastChange = now
+            pending |= changed
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Re-plot the schedule queue stats as simulation results are appended")
+    parser.add_argument("root", help="Results tree or run set directory to watch (e.g., 'completed_logs')")
+    parser.add_argument("--poll", action='store_true', help="Poll for changes instead of using inotify")
+    parser.add_argument("--once", action='store_true', help="Plot what is there and exit")
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    if not os.path.isdir(args.root):
+        print('Invalid path to source')
+        sys.exit(1)
+
+    # Headless rendering for a long-running process
+    import matplotlib
+    matplotlib.use('Agg')
+    import temp as pipeline
+
+    try:
+        watch(os.path.normpath(args.root), pipeline, args.poll, args.once)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()